@@ -0,0 +1,264 @@
+"""
+This script runs our AI opponents in the background so the game window keeps responding while they think
+the built-in search runs in a worker process (spread over every core with ParallelSearch when there are several),
+stockfish is driven from a worker thread (the engine is a process of its own, the thread only waits on its pipe)
+results come back through a queue that the game loop polls once per frame
+after moving, the AI can ponder: search the reply it expects on the opponent's time,
+if the opponent plays it the running search just carries on, otherwise it is cancelled
+"""
+
+import concurrent.futures
+import functools
+import multiprocessing
+import queue
+import random
+from Chess import Engine, MoveAI, ParallelSearch, stock
+
+"""
+CONSTANTS
+"""
+
+NO_SEARCH = 0  # value of the active search id when no result is wanted
+
+PONDER_LEVELS = ('medium', 'hard')  # the easy search is too short to be worth pondering
+PARALLEL_LEVELS = ('medium',) if ParallelSearch.WORKERS > 1 else ()  # levels searched on every core
+
+activeSearchId = None  # shared multiprocessing.Value inside the worker process
+ponderHitSearchId = None  # id of the pondering search whose predicted move was played
+
+"""
+Helper method run once in the worker process, the search ids are shared with the game
+"""
+
+
+def initWorker(sharedSearchId, sharedPonderHit):
+    global activeSearchId, ponderHitSearchId
+    activeSearchId = sharedSearchId
+    ponderHitSearchId = sharedPonderHit
+
+
+"""
+Method run in the worker process: rebuilds the game from its serialized form and searches it,
+returns the codes of the chosen move and of the reply expected from the principal variation (either can be None)
+- the search stops early once the game starts another search or cancels this one
+- a ponder search has no time limit until the game reports its ponder hit
+"""
+
+
+def runSearch(searchId, level, startFen, moveCodes, ponder=False):
+    gamestate = Engine.gameStateFromHistory(startFen, moveCodes)
+    validMoves = gamestate.getValidMoves()
+    MoveAI.setStopSignal(lambda: activeSearchId.value != searchId)
+    if level == 'easy':
+        return codeOf(MoveAI.findBestMove(gamestate, validMoves)), None
+    ponderHit = (lambda: ponderHitSearchId.value == searchId) if ponder else None
+    move = MoveAI.findBestMove2(gamestate, validMoves, ponderHit)
+    principalVariation = MoveAI.getPrincipalVariation(gamestate, 2) if move is not None else []
+    expectedReply = principalVariation[1][1] if len(principalVariation) > 1 and principalVariation[0][1] is move else None
+    return codeOf(move), codeOf(expectedReply)
+
+
+def codeOf(move):
+    return move.code if move is not None else None
+
+
+"""
+Method run in the worker thread for stockfish on a copy of the game, since the game loop goes on playing moves,
+game is the live game, only used to tell whether the engine needs a ucinewgame
+- hitSignal latches the ponder hit: the predicted move can be played before the thread even sends 'go ponder'
+"""
+
+
+def runStockfishSearch(gamestate, validMoves, game, ponderMove=None, hitSignal=None):
+    return stock.searchStockfish(gamestate, validMoves, ponderMove=ponderMove, hitSignal=hitSignal, game=game)
+
+
+class AIWorker():
+    def __init__(self):
+        self.results = queue.Queue()
+        self.sharedSearchId = multiprocessing.Value('i', NO_SEARCH)
+        self.sharedPonderHit = multiprocessing.Value('i', NO_SEARCH)
+        self.searchId = NO_SEARCH
+        self.expectedReply = None  # from the last result: move code (built-in search) or UCI string (stockfish)
+        self.ponderMove = None  # the predicted move the running ponder search assumes
+        self.ponderGame = None
+        self.ponderLogLength = 0
+        self.finished = None  # result of the current search, once it came in
+        self.processes = None  # started on the first built-in search
+        self.threads = None  # started on the first stockfish or parallel search
+        self.parallelSearch = None
+
+    """
+    Method to start thinking about the position for the given difficulty, the result is picked up with poll()
+    - when the last move is the one the AI was pondering on, the ponder search simply goes on
+    - any other search that is still running is cancelled first
+    """
+
+    def start(self, gamestate, validMoves, level):
+        if self.ponderMove is not None and self.isThinking() and gamestate is self.ponderGame and \
+                len(gamestate.moveLog) == self.ponderLogLength and gamestate.moveLog[-1] is self.ponderMove:
+            self.ponderMove = None
+            self.sharedPonderHit.value = self.searchId
+            stock.ponderHit()
+            return
+        self.cancel()
+        self.submit(gamestate, validMoves, level)
+
+    """
+    Method to ponder after the AI moved: search the position after the reply it expects,
+    validMoves being the opponent's valid moves, nothing happens when no reply is expected
+    """
+
+    def ponder(self, gamestate, validMoves, level):
+        self.cancel()
+        expectedReply = self.expectedReply
+        if level not in PONDER_LEVELS or expectedReply is None:
+            return
+        for move in validMoves:
+            if move.code == expectedReply or move.getChessNotation() == str(expectedReply)[:4]:
+                break
+        else:
+            return
+        gamestate.makeMove(move)
+        replies = gamestate.getValidMoves()
+        gamestate.undoMove()
+        if not replies:
+            return
+        self.submit(gamestate, replies, level, move)
+        self.ponderMove = move
+        self.ponderGame = gamestate
+        self.ponderLogLength = len(gamestate.moveLog) + 1
+
+    """
+    Helper method to hand a search to the right worker, with ponderMove the search is for the position after it
+    """
+
+    def submit(self, gamestate, validMoves, level, ponderMove=None):
+        self.searchId += 1
+        self.sharedSearchId.value = self.searchId
+        self.expectedReply = None
+        if level == 'hard':
+            if self.threads is None:
+                self.threads = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            hitSignal = functools.partial(self.ponderHitFor, self.searchId) if ponderMove is not None else None
+            # like the parallel search the thread gets its own copy of the game, this one goes on being played
+            future = self.threads.submit(runStockfishSearch, Engine.gameStateFromHistory(*gamestate.serialize()),
+                                         list(validMoves), gamestate, ponderMove, hitSignal)
+        elif level in PARALLEL_LEVELS:
+            if self.threads is None:
+                self.threads = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            if self.parallelSearch is None:
+                self.parallelSearch = ParallelSearch.createSearch()
+            startFen, moveCodes = gamestate.serialize()
+            if ponderMove is not None:
+                moveCodes.append(ponderMove.code)
+            # the search thread gets its own copy of the game, this one goes on being played
+            future = self.threads.submit(self.runParallelSearch, self.searchId,
+                                         Engine.gameStateFromHistory(startFen, moveCodes), list(validMoves),
+                                         ponderMove is not None)
+        else:
+            if self.processes is None:
+                self.processes = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1, initializer=initWorker, initargs=(self.sharedSearchId, self.sharedPonderHit))
+            startFen, moveCodes = gamestate.serialize()
+            if ponderMove is not None:
+                moveCodes.append(ponderMove.code)
+            future = self.processes.submit(runSearch, self.searchId, level, startFen, moveCodes, ponderMove is not None)
+        future.add_done_callback(functools.partial(self.deliver, self.searchId, list(validMoves)))
+
+    def ponderHitFor(self, searchId):
+        return self.sharedPonderHit.value == searchId
+
+    """
+    Method run in the worker thread: the root-parallel search, stopped and ponder-hit through the shared search ids
+    """
+
+    def runParallelSearch(self, searchId, gamestate, validMoves, ponder):
+        knownMove = MoveAI.findBookMove(gamestate, validMoves)  # the opening book or the endgame tablebase
+        if knownMove is None:
+            knownMove = MoveAI.findTablebaseMove(gamestate, validMoves)
+        if knownMove is not None:
+            return knownMove, None
+        random.shuffle(validMoves)
+        ponderHit = (lambda: self.sharedPonderHit.value == searchId) if ponder else None
+        return self.parallelSearch.findBestMove(gamestate, validMoves,
+                                                stopSignal=lambda: self.sharedSearchId.value != searchId,
+                                                ponderHit=ponderHit)
+
+    """
+    Helper method called when a search finishes, in whichever thread finished it
+    - the move is looked up among the valid moves it was searched for
+    - stockfish failing to run (e.g: not installed) gives None, the game falls back to a random move,
+      any other error is handed to poll() which raises it in the game loop
+    """
+
+    def deliver(self, searchId, validMoves, future):
+        if future.cancelled():  # dropped on shutdown
+            return
+        try:
+            result, expectedReply = future.result()
+        except (stock.EngineError, OSError):
+            result, expectedReply = None, None
+        except Exception as error:
+            self.results.put((searchId, error, None))
+            return
+        move = None
+        if isinstance(result, Engine.Move):
+            move = result
+        elif result is not None:
+            for validMove in validMoves:
+                if validMove.code == result:
+                    move = validMove
+                    break
+        self.results.put((searchId, move, expectedReply))
+
+    """
+    Method to check for the result of the current search without waiting,
+    returns (finished, move), results of cancelled searches are dropped
+    - a ponder search that finished early is held back until its ponder hit
+    - an error raised by the current search is raised again here
+    """
+
+    def poll(self):
+        while self.finished is None:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                return False, None
+            if result[0] == self.searchId and result[0] == self.sharedSearchId.value:
+                self.finished = result
+        if self.ponderMove is not None:
+            return False, None
+        _, move, expectedReply = self.finished
+        self.finished = None
+        self.sharedSearchId.value = NO_SEARCH
+        if isinstance(move, Exception):
+            raise move
+        self.expectedReply = expectedReply
+        return True, move
+
+    def isThinking(self):
+        return self.sharedSearchId.value != NO_SEARCH
+
+    """
+    Method to abandon the current search, its result will never be returned
+    """
+
+    def cancel(self):
+        self.ponderMove = None
+        self.ponderGame = None
+        self.finished = None
+        if self.sharedSearchId.value != NO_SEARCH:
+            self.sharedSearchId.value = NO_SEARCH
+            stock.stopSearches()
+
+    def shutdown(self):
+        self.cancel()
+        for executor in (self.processes, self.threads):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        if self.parallelSearch is not None:
+            self.parallelSearch.shutdown()
+        self.processes = None
+        self.threads = None
+        self.parallelSearch = None
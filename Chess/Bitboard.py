@@ -0,0 +1,662 @@
+"""
+This script contains the bitboard backend of our engine
+the position is stored as one 64-bit integer per piece type and color
+(bit r * 8 + c is set when the piece stands on board[r][c]) plus occupancy masks,
+so move generation and attack tests become a handful of integer operations
+instead of walking the 8x8 grid one square at a time
+- legal moves come straight out of masks: the squares that block or capture a check,
+  the ray a pinned piece may slide along and the squares the enemy attacks with our king lifted
+- slider attacks are looked up by square and relevant occupancy, each entry is worked out once and kept
+"""
+
+from Chess import Engine
+
+"""
+CONSTANTS
+"""
+
+FULL = (1 << 64) - 1
+PIECES = ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')
+SEE_ORDER = ('p', 'N', 'B', 'R', 'Q', 'K')  # cheapest attacker first, knights before bishops like GameState.see
+
+# square index step for every direction, positive steps scan towards h1 and negative ones towards a8
+NORTH, SOUTH, EAST, WEST = -8, 8, 1, -1
+NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = -7, -9, 9, 7
+ROOK_DIRECTIONS = {NORTH: (-1, 0), SOUTH: (1, 0), EAST: (0, 1), WEST: (0, -1)}
+BISHOP_DIRECTIONS = {NORTH_EAST: (-1, 1), NORTH_WEST: (-1, -1), SOUTH_EAST: (1, 1), SOUTH_WEST: (1, -1)}
+
+ROW_MASKS = [0xFF << (8 * r) for r in range(8)]
+NOT_FIRST_COL = FULL ^ sum(1 << (r * 8) for r in range(8))
+NOT_LAST_COL = FULL ^ sum(1 << (r * 8 + 7) for r in range(8))
+SQUARES = [divmod(sq, 8) for sq in range(64)]  # (row, col) of every square index
+
+
+def squareBit(r, c):
+    return 1 << (r * 8 + c)
+
+
+def squareOf(bit):
+    return bit.bit_length() - 1
+
+
+def leaperTable(offsets):
+    table = []
+    for r in range(8):
+        for c in range(8):
+            mask = 0
+            for dr, dc in offsets:
+                if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                    mask |= squareBit(r + dr, c + dc)
+            table.append(mask)
+    return table
+
+
+def rayTable(dr, dc):
+    table = []
+    for r in range(8):
+        for c in range(8):
+            mask = 0
+            endRow, endCol = r + dr, c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                mask |= squareBit(endRow, endCol)
+                endRow += dr
+                endCol += dc
+            table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = leaperTable(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = leaperTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# squares attacked by a pawn of the given color standing on the square
+PAWN_ATTACKS = {'w': leaperTable(((-1, -1), (-1, 1))), 'b': leaperTable(((1, -1), (1, 1)))}
+RAYS = {step: rayTable(dr, dc) for step, (dr, dc) in list(ROOK_DIRECTIONS.items()) + list(BISHOP_DIRECTIONS.items())}
+
+
+def relevantMask(sq, steps):
+    # the last square of a ray is seen whatever stands on it, so only the squares before it can block
+    mask = 0
+    for step in steps:
+        ray = RAYS[step][sq]
+        if ray:
+            last = squareOf(ray) if step > 0 else squareOf(ray & -ray)
+            mask |= ray & ~(1 << last)
+    return mask
+
+
+def betweenTable():
+    table = [[0] * 64 for _ in range(64)]
+    for step in RAYS:
+        for sq in range(64):
+            ray = RAYS[step][sq]
+            while ray:
+                bit = ray & -ray
+                ray ^= bit
+                target = squareOf(bit)
+                table[sq][target] = RAYS[step][sq] & ~RAYS[step][target] & ~bit
+    return table
+
+
+ROOK_MASKS = [relevantMask(sq, ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_MASKS = [relevantMask(sq, BISHOP_DIRECTIONS) for sq in range(64)]
+# attacks of a rook or bishop on an empty board, to find the sliders that could pin a piece to the king
+ROOK_EMPTY = [RAYS[NORTH][sq] | RAYS[SOUTH][sq] | RAYS[EAST][sq] | RAYS[WEST][sq] for sq in range(64)]
+BISHOP_EMPTY = [RAYS[NORTH_EAST][sq] | RAYS[NORTH_WEST][sq] | RAYS[SOUTH_EAST][sq] | RAYS[SOUTH_WEST][sq]
+                for sq in range(64)]
+# squares strictly between two squares on one line, 0 when they don't share a line
+BETWEEN = betweenTable()
+# slider attacks by square and relevant occupancy, filled on first use
+ROOK_CACHE = [{} for _ in range(64)]
+BISHOP_CACHE = [{} for _ in range(64)]
+# castling: (king square, squares that must be empty, squares that must not be attacked, king target)
+CASTLING = {'wks': (60, 0x6 << 60, 0x6 << 60, 62), 'wqs': (60, 0xE << 56, 0xC << 56, 58),
+            'bks': (4, 0x6 << 4, 0x6 << 4, 6), 'bqs': (4, 0xE, 0xC, 2)}
+QUIET_MOVES = {}  # (piece code, square, target mask) -> the pooled quiet moves of the piece
+
+"""
+Helper method to get the squares a slider sees along one ray, up to and including the first blocker
+"""
+
+
+def rayAttacks(sq, occupied, step):
+    ray = RAYS[step][sq]
+    blockers = ray & occupied
+    if blockers:
+        if step > 0:  # nearest blocker is the lowest set bit
+            first = squareOf(blockers & -blockers)
+        else:  # nearest blocker is the highest set bit
+            first = squareOf(blockers)
+        ray ^= RAYS[step][first]
+    return ray
+
+
+def rookAttacks(sq, occupied):
+    blockers = occupied & ROOK_MASKS[sq]
+    attacks = ROOK_CACHE[sq].get(blockers)
+    if attacks is None:
+        attacks = ROOK_CACHE[sq][blockers] = (rayAttacks(sq, blockers, NORTH) | rayAttacks(sq, blockers, SOUTH) |
+                                              rayAttacks(sq, blockers, EAST) | rayAttacks(sq, blockers, WEST))
+    return attacks
+
+
+def bishopAttacks(sq, occupied):
+    blockers = occupied & BISHOP_MASKS[sq]
+    attacks = BISHOP_CACHE[sq].get(blockers)
+    if attacks is None:
+        attacks = BISHOP_CACHE[sq][blockers] = (
+                rayAttacks(sq, blockers, NORTH_EAST) | rayAttacks(sq, blockers, NORTH_WEST) |
+                rayAttacks(sq, blockers, SOUTH_EAST) | rayAttacks(sq, blockers, SOUTH_WEST))
+    return attacks
+
+
+"""
+Helper method to get the squares attacked by all the pawns of a color at once
+"""
+
+
+def pawnAttacks(pawns, color):
+    if color == 'w':
+        return ((pawns & NOT_FIRST_COL) >> 9) | ((pawns & NOT_LAST_COL) >> 7)
+    return (((pawns & NOT_FIRST_COL) << 7) | ((pawns & NOT_LAST_COL) << 9)) & FULL
+
+
+"""
+Helper method to get the pooled move between two square indexes, see Engine.getMove
+"""
+
+
+def poolMove(start, end, board, isEnPassantMove=False, isCastleMove=False):
+    startRow, startCol = SQUARES[start]
+    endRow, endCol = SQUARES[end]
+    key = (start << 6 | end | isEnPassantMove << 12 | isCastleMove << 13 |
+           Engine.PIECE_CODES[board[startRow][startCol]] << 14 | Engine.PIECE_CODES[board[endRow][endCol]] << 18)
+    move = Engine.movePool.get(key)
+    if move is None:
+        move = Engine.getMove(SQUARES[start], SQUARES[end], board, isEnPassantMove, isCastleMove)
+    return move
+
+
+class BitboardBoard():
+    def __init__(self, board):
+        self.pieces = {piece: 0 for piece in PIECES}
+        self.occupancy = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] != "-":
+                    self.addPiece(board[r][c], r * 8 + c)
+
+    def addPiece(self, piece, sq):
+        bit = 1 << sq
+        self.pieces[piece] |= bit
+        self.occupancy[piece[0]] |= bit
+
+    def removePiece(self, piece, sq):
+        bit = 1 << sq
+        self.pieces[piece] &= ~bit
+        self.occupancy[piece[0]] &= ~bit
+
+    """
+    Method that mirrors GameState.makeMove on the bitboards, every piece that moves is a pair of xors
+    """
+
+    def makeMove(self, move):
+        pieces = self.pieces
+        occupancy = self.occupancy
+        moved = move.pieceMoved
+        color = moved[0]
+        startBit = 1 << (move.startRow * 8 + move.startCol)
+        endBit = 1 << (move.endRow * 8 + move.endCol)
+        captured = move.pieceCaptured
+        if captured != "-":
+            capturedBit = 1 << (move.startRow * 8 + move.endCol) if move.isEnPassantMove else endBit
+            pieces[captured] ^= capturedBit
+            occupancy[captured[0]] ^= capturedBit
+        if move.isPawnPromotion:
+            pieces[moved] ^= startBit
+            pieces[color + 'Q'] ^= endBit
+        else:
+            pieces[moved] ^= startBit | endBit
+        occupancy[color] ^= startBit | endBit
+        if move.isCastleMove:
+            rookBits = endBit << 1 | endBit >> 1 if move.endCol - move.startCol == 2 else endBit >> 2 | endBit << 1
+            pieces[color + 'R'] ^= rookBits
+            occupancy[color] ^= rookBits
+
+    """
+    Method that mirrors GameState.undoMove on the bitboards, the same xors again
+    """
+
+    def undoMove(self, move):
+        self.makeMove(move)
+
+    """
+    Method to get the pieces of the given color attacking the square
+    """
+
+    def attackersTo(self, sq, byColor, occupied):
+        pieces = self.pieces
+        queens = pieces[byColor + 'Q']
+        return ((KNIGHT_ATTACKS[sq] & pieces[byColor + 'N']) | (KING_ATTACKS[sq] & pieces[byColor + 'K']) |
+                (PAWN_ATTACKS['b' if byColor == 'w' else 'w'][sq] & pieces[byColor + 'p']) |
+                (rookAttacks(sq, occupied) & (pieces[byColor + 'R'] | queens)) |
+                (bishopAttacks(sq, occupied) & (pieces[byColor + 'B'] | queens)))
+
+    """
+    Method to determine if any piece of the given color attacks the square
+    """
+
+    def squareAttacked(self, sq, byColor, occupied=None):
+        if occupied is None:
+            occupied = self.occupancy['w'] | self.occupancy['b']
+        return self.attackersTo(sq, byColor, occupied) != 0
+
+    """
+    Method to get every square the pieces of a color attack, sliders see through the squares left out of occupied
+    """
+
+    def attackMask(self, color, occupied):
+        pieces = self.pieces
+        attacks = pawnAttacks(pieces[color + 'p'], color)
+        if pieces[color + 'K']:
+            attacks |= KING_ATTACKS[squareOf(pieces[color + 'K'])]
+        knights = pieces[color + 'N']
+        while knights:
+            bit = knights & -knights
+            knights ^= bit
+            attacks |= KNIGHT_ATTACKS[bit.bit_length() - 1]
+        queens = pieces[color + 'Q']
+        rooks = pieces[color + 'R'] | queens
+        while rooks:
+            bit = rooks & -rooks
+            rooks ^= bit
+            attacks |= rookAttacks(bit.bit_length() - 1, occupied)
+        bishops = pieces[color + 'B'] | queens
+        while bishops:
+            bit = bishops & -bishops
+            bishops ^= bit
+            attacks |= bishopAttacks(bit.bit_length() - 1, occupied)
+        return attacks
+
+    """
+    Method to get the number of pieces of the given color attacking every square, like GameState.getAttackMap
+    """
+
+    def attackCounts(self, color):
+        attackMap = [[0] * 8 for _ in range(8)]
+        pieces = self.pieces
+        occupied = self.occupancy['w'] | self.occupancy['b']
+        for piece in PIECES:
+            if piece[0] != color:
+                continue
+            kind = piece[1]
+            bb = pieces[piece]
+            while bb:
+                bit = bb & -bb
+                bb ^= bit
+                sq = bit.bit_length() - 1
+                if kind == 'p':
+                    targets = PAWN_ATTACKS[color][sq]
+                elif kind == 'N':
+                    targets = KNIGHT_ATTACKS[sq]
+                elif kind == 'K':
+                    targets = KING_ATTACKS[sq]
+                elif kind == 'R':
+                    targets = rookAttacks(sq, occupied)
+                elif kind == 'B':
+                    targets = bishopAttacks(sq, occupied)
+                else:
+                    targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                while targets:
+                    target = targets & -targets
+                    targets ^= target
+                    r, c = SQUARES[target.bit_length() - 1]
+                    attackMap[r][c] += 1
+        return attackMap
+
+    """
+    Method to determine if the king of the given color is attacked
+    """
+
+    def kingAttacked(self, color):
+        king = self.pieces[color + 'K']
+        if not king:
+            return False
+        return self.squareAttacked(squareOf(king), 'b' if color == 'w' else 'w')
+
+    """
+    Method to determine if the king can step to the end square of the move,
+    the king is lifted from the occupancy so sliders see through its old square
+    """
+
+    def kingMoveIsSafe(self, move):
+        color = move.pieceMoved[0]
+        occupied = (self.occupancy['w'] | self.occupancy['b']) & ~(1 << (move.startRow * 8 + move.startCol))
+        return not self.squareAttacked(move.endRow * 8 + move.endCol, 'b' if color == 'w' else 'w', occupied)
+
+    """
+    Method to find the legal moves of the side to move, returns (moves, in check)
+    - in double check only the king moves, in single check the other pieces must land on checkMask
+      (the checker or a square between it and the king), a pinned piece must stay on its pin ray
+    - en passant can uncover a check along the rank no pin ray shows, so it is tried on the bitboards
+    """
+
+    def getValidMoves(self, gamestate):
+        pieces = self.pieces
+        board = gamestate.board
+        movePool = Engine.movePool
+        pieceCodes = Engine.PIECE_CODES
+        ally, enemy = ('w', 'b') if gamestate.whiteToMove else ('b', 'w')
+        allyOcc = self.occupancy[ally]
+        enemyOcc = self.occupancy[enemy]
+        occupied = allyOcc | enemyOcc
+        empty = FULL ^ occupied
+        notAlly = FULL ^ allyOcc
+        moves = []
+        kingBit = pieces[ally + 'K']
+        if not kingBit:  # no king (e.g: a test position), nothing can be pinned or checked
+            return self.getAllMoves(gamestate), False
+        kingSq = kingBit.bit_length() - 1
+        danger = self.attackMask(enemy, occupied ^ kingBit)
+        checkers = self.attackersTo(kingSq, enemy, occupied)
+        self.appendTargets(kingSq, KING_ATTACKS[kingSq] & notAlly & ~danger, board, moves)
+        if checkers & (checkers - 1):  # double check
+            return moves, True
+        if checkers:
+            checkMask = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+        else:
+            checkMask = FULL
+            rights = gamestate.currentCastlingRight
+            for side, allowed in (('ks', rights.wks if ally == 'w' else rights.bks),
+                                  ('qs', rights.wqs if ally == 'w' else rights.bqs)):
+                kingStart, needEmpty, needSafe, kingTarget = CASTLING[ally + side]
+                if allowed and kingStart == kingSq and not occupied & needEmpty and not danger & needSafe:
+                    moves.append(poolMove(kingSq, kingTarget, board, isCastleMove=True))
+
+        # pinned pieces: an enemy slider on a line with the king and exactly one of our pieces in between
+        pinRays = {}
+        pinned = 0
+        queens = pieces[enemy + 'Q']
+        snipers = (ROOK_EMPTY[kingSq] & (pieces[enemy + 'R'] | queens)) | \
+                  (BISHOP_EMPTY[kingSq] & (pieces[enemy + 'B'] | queens))
+        betweenKing = BETWEEN[kingSq]
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            between = betweenKing[bit.bit_length() - 1]
+            blockers = between & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & allyOcc:
+                pinned |= blockers
+                pinRays[blockers.bit_length() - 1] = between | bit
+
+        # pawns, the unpinned ones push in bulk
+        pawns = pieces[ally + 'p']
+        pawnCode = pieceCodes[ally + 'p'] << 14
+        free = pawns & ~pinned
+        if ally == 'w':
+            single = (free >> 8) & empty
+            double = ((single & ROW_MASKS[5]) >> 8) & empty & checkMask
+            back = 8
+        else:
+            single = (free << 8) & empty
+            double = ((single & ROW_MASKS[2]) << 8) & empty & checkMask
+            back = -8
+        single &= checkMask
+        for targets, distance in ((single, back), (double, 2 * back)):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                end = bit.bit_length() - 1
+                move = movePool.get((end + distance) << 6 | end | pawnCode)
+                moves.append(move if move is not None else poolMove(end + distance, end, board))
+        pawnTargets = PAWN_ATTACKS[ally]
+        captureMask = enemyOcc & checkMask
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            sq = bit.bit_length() - 1
+            targets = pawnTargets[sq] & captureMask
+            if bit & pinned:
+                pinRay = pinRays[sq]
+                targets &= pinRay
+                push = (bit >> 8 if ally == 'w' else bit << 8) & empty & pinRay
+                if push:  # pinned along its file, it can still push
+                    targets |= push & checkMask
+                    if push & ROW_MASKS[5 if ally == 'w' else 2]:
+                        targets |= (push >> 8 if ally == 'w' else push << 8) & empty & checkMask
+            if targets:
+                self.appendTargets(sq, targets, board, moves)
+        if gamestate.enPassantPossible:
+            epSq = gamestate.enPassantPossible[0] * 8 + gamestate.enPassantPossible[1]
+            takers = PAWN_ATTACKS[enemy][epSq] & pieces[ally + 'p']
+            while takers:
+                bit = takers & -takers
+                takers ^= bit
+                move = poolMove(bit.bit_length() - 1, epSq, board, isEnPassantMove=True)
+                if self.leavesKingSafe(move):
+                    moves.append(move)
+
+        # knights (a pinned knight never has a move) and sliders
+        knights = pieces[ally + 'N'] & ~pinned
+        targetMask = notAlly & checkMask
+        while knights:
+            bit = knights & -knights
+            knights ^= bit
+            sq = bit.bit_length() - 1
+            self.appendTargets(sq, KNIGHT_ATTACKS[sq] & targetMask, board, moves)
+        for kind, attacks in (('R', rookAttacks), ('B', bishopAttacks), ('Q', None)):
+            sliders = pieces[ally + kind]
+            while sliders:
+                bit = sliders & -sliders
+                sliders ^= bit
+                sq = bit.bit_length() - 1
+                if attacks is None:
+                    targets = (rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)) & targetMask
+                else:
+                    targets = attacks(sq, occupied) & targetMask
+                if bit & pinned:
+                    targets &= pinRays[sq]
+                self.appendTargets(sq, targets, board, moves)
+        return moves, checkers != 0
+
+    """
+    Helper method to turn a target mask into moves from the given square:
+    the quiet moves of a piece come as one cached list, captures are looked up one by one
+    """
+
+    def appendTargets(self, sq, targets, board, moves):
+        if not targets:
+            return
+        startRow, startCol = SQUARES[sq]
+        pieceCode = Engine.PIECE_CODES[board[startRow][startCol]]
+        quiet = targets & ~(self.occupancy['w'] | self.occupancy['b'])
+        if quiet:
+            key = (pieceCode << 6 | sq) << 64 | quiet
+            quietMoves = QUIET_MOVES.get(key)
+            if quietMoves is None:
+                quietMoves = QUIET_MOVES[key] = []
+                while quiet:
+                    bit = quiet & -quiet
+                    quiet ^= bit
+                    quietMoves.append(poolMove(sq, bit.bit_length() - 1, board))
+            moves.extend(quietMoves)
+        captures = targets & (self.occupancy['w'] | self.occupancy['b'])
+        if captures:
+            movePool = Engine.movePool
+            pieceCodes = Engine.PIECE_CODES
+            base = sq << 6 | pieceCode << 14
+            while captures:
+                bit = captures & -captures
+                captures ^= bit
+                end = bit.bit_length() - 1
+                endRow, endCol = SQUARES[end]
+                move = movePool.get(base | end | pieceCodes[board[endRow][endCol]] << 18)
+                moves.append(move if move is not None else poolMove(sq, end, board))
+
+    """
+    Method to find all pseudo-legal moves (castling excluded) for the side to move
+    """
+
+    def getAllMoves(self, gamestate):
+        moves = []
+        board = gamestate.board
+        pieces = self.pieces
+        ally, enemy = ('w', 'b') if gamestate.whiteToMove else ('b', 'w')
+        allyOcc = self.occupancy[ally]
+        enemyOcc = self.occupancy[enemy]
+        empty = ~(allyOcc | enemyOcc) & FULL
+        notAlly = ~allyOcc & FULL
+        occupied = allyOcc | enemyOcc
+
+        # pawns: pushes in bulk, captures square by square
+        pawns = pieces[ally + 'p']
+        if ally == 'w':
+            single = (pawns >> 8) & empty
+            double = ((single & ROW_MASKS[5]) >> 8) & empty
+            back = 8
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & ROW_MASKS[2]) << 8) & empty
+            back = -8
+        for targets, distance in ((single, back), (double, 2 * back)):
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                end = squareOf(bit)
+                moves.append(poolMove(end + distance, end, board))
+        epBit = squareBit(*gamestate.enPassantPossible) if gamestate.enPassantPossible else 0
+        pawnTargets = PAWN_ATTACKS[ally]
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            sq = squareOf(bit)
+            self.appendTargets(sq, pawnTargets[sq] & enemyOcc, board, moves)
+            if pawnTargets[sq] & epBit:
+                moves.append(poolMove(sq, squareOf(epBit), board, isEnPassantMove=True))
+
+        # knights and king
+        for piece, table in (('N', KNIGHT_ATTACKS), ('K', KING_ATTACKS)):
+            bb = pieces[ally + piece]
+            while bb:
+                bit = bb & -bb
+                bb ^= bit
+                sq = squareOf(bit)
+                self.appendTargets(sq, table[sq] & notAlly, board, moves)
+
+        # sliders
+        rooksQueens = pieces[ally + 'R'] | pieces[ally + 'Q']
+        bishopsQueens = pieces[ally + 'B'] | pieces[ally + 'Q']
+        while rooksQueens:
+            bit = rooksQueens & -rooksQueens
+            rooksQueens ^= bit
+            sq = squareOf(bit)
+            self.appendTargets(sq, rookAttacks(sq, occupied) & notAlly, board, moves)
+        while bishopsQueens:
+            bit = bishopsQueens & -bishopsQueens
+            bishopsQueens ^= bit
+            sq = squareOf(bit)
+            self.appendTargets(sq, bishopAttacks(sq, occupied) & notAlly, board, moves)
+        return moves
+
+    """
+    Method to generate the captures and promotion pushes of the side to move, pseudo-legal like
+    GameState.getCaptureMoves
+    """
+
+    def getCaptureMoves(self, gamestate):
+        moves = []
+        board = gamestate.board
+        pieces = self.pieces
+        ally, enemy = ('w', 'b') if gamestate.whiteToMove else ('b', 'w')
+        enemyOcc = self.occupancy[enemy]
+        occupied = self.occupancy[ally] | enemyOcc
+        pawns = pieces[ally + 'p']
+        if ally == 'w':
+            promotions = ((pawns & ROW_MASKS[1]) >> 8) & ~occupied
+            back = 8
+        else:
+            promotions = ((pawns & ROW_MASKS[6]) << 8) & ~occupied
+            back = -8
+        epBit = squareBit(*gamestate.enPassantPossible) if gamestate.enPassantPossible else 0
+        pawnTargets = PAWN_ATTACKS[ally]
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            sq = bit.bit_length() - 1
+            self.appendTargets(sq, pawnTargets[sq] & enemyOcc, board, moves)
+            if pawnTargets[sq] & epBit:
+                moves.append(poolMove(sq, squareOf(epBit), board, isEnPassantMove=True))
+        while promotions:
+            bit = promotions & -promotions
+            promotions ^= bit
+            end = bit.bit_length() - 1
+            moves.append(poolMove(end + back, end, board))
+        queens = pieces[ally + 'Q']
+        for kind, table in (('N', KNIGHT_ATTACKS), ('K', KING_ATTACKS)):
+            bb = pieces[ally + kind]
+            while bb:
+                bit = bb & -bb
+                bb ^= bit
+                sq = bit.bit_length() - 1
+                self.appendTargets(sq, table[sq] & enemyOcc, board, moves)
+        for kind in ('R', 'B'):
+            sliders = pieces[ally + kind] | queens
+            attacks = rookAttacks if kind == 'R' else bishopAttacks
+            while sliders:
+                bit = sliders & -sliders
+                sliders ^= bit
+                sq = bit.bit_length() - 1
+                self.appendTargets(sq, attacks(sq, occupied) & enemyOcc, board, moves)
+        return moves
+
+    """
+    Method to get the static exchange evaluation of a capture, see GameState.see:
+    the attackers of the target square are taken cheapest first, and the sliders behind a piece
+    that has taken (x-rays) join in as the occupancy is recomputed
+    """
+
+    def see(self, move):
+        pieces = self.pieces
+        values = Engine.SEE_VALUES
+        target = move.endRow * 8 + move.endCol
+        occupied = (self.occupancy['w'] | self.occupancy['b']) & ~(1 << (move.startRow * 8 + move.startCol))
+        rooksQueens = pieces['wR'] | pieces['bR'] | pieces['wQ'] | pieces['bQ']
+        bishopsQueens = pieces['wB'] | pieces['bB'] | pieces['wQ'] | pieces['bQ']
+        attackers = (self.attackersTo(target, 'w', occupied) | self.attackersTo(target, 'b', occupied)) & occupied
+        if move.isPawnPromotion:
+            gains = [values[move.pieceCaptured[1]] + values['Q'] - values['p']
+                     if move.isCapture else values['Q'] - values['p']]
+            onSquare = values['Q']
+        else:
+            gains = [values[move.pieceCaptured[1]] if move.isCapture else 0]
+            onSquare = values[move.pieceMoved[1]]
+        side = 'b' if move.pieceMoved[0] == 'w' else 'w'
+        while True:
+            own = attackers & self.occupancy[side]
+            if not own:
+                break
+            for kind in SEE_ORDER:
+                candidates = own & pieces[side + kind]
+                if candidates:
+                    break
+            other = 'b' if side == 'w' else 'w'
+            if kind == 'K' and attackers & self.occupancy[other]:
+                break  # the king can't take a defended piece
+            gains.append(onSquare - gains[-1])
+            onSquare = values[kind]
+            occupied ^= candidates & -candidates
+            attackers = (attackers | (rookAttacks(target, occupied) & rooksQueens) |
+                         (bishopAttacks(target, occupied) & bishopsQueens)) & occupied
+            side = other
+        # each side may stop taking when going on would lose, so back the gains up from the end
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+        return gains[0]
+
+    """
+    Method to check a move for legality by playing it on the bitboards only
+    """
+
+    def leavesKingSafe(self, move):
+        self.makeMove(move)
+        safe = not self.kingAttacked(move.pieceMoved[0])
+        self.undoMove(move)
+        return safe
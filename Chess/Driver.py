@@ -7,7 +7,7 @@
 
 import pygame as pyg
 import sys
-from Chess import Engine, MoveAI, stock
+from Chess import Engine, MoveAI, AIWorker
 from button import Button  # Assuming you have a Button class implemented
 
 """
@@ -22,12 +22,6 @@ max_fps = 15
 squareSize = board_height // dimension
 IMAGES = {}
 
-# Initializing Pygame window
-pyg.init()
-screen = pyg.display.set_mode((768, 512))
-clock = pyg.time.Clock()
-pyg.display.set_caption("ChessAI")
-
 """
 Helper method to load our images dictionary of pieces
 """
@@ -161,7 +155,7 @@ def animateMove(move, screen, board, clock):
         pyg.draw.rect(screen, color, endSquare)
         if move.pieceCaptured != "-":
             if move.isEnPassantMove:
-                enPassantRow = (move.endRow + 1) if move.piececaptured[0] == 'b' else (move.endRow - 1)
+                enPassantRow = (move.endRow + 1) if move.pieceCaptured[0] == 'b' else (move.endRow - 1)
                 endSquare = pyg.Rect(move.endCol * squareSize, enPassantRow * squareSize, squareSize, squareSize)
             screen.blit(IMAGES[move.pieceCaptured], endSquare)
         # draw moving piece
@@ -379,6 +373,9 @@ def play_screen(playerOne, playerTwo, ai_level=None):
     # playerOne = True  # if human plays W this is true
     # playerTwo = False
     gamestate, validMoves = initialize_game()
+    aiWorker = AIWorker.AIWorker()  # the AI thinks in the background so this loop keeps drawing and handling input
+    aiThinking = False
+    aiMoved = False  # the AI just moved, so it can ponder on the human's reply
     running = True
     while running:
         isHumanTurn = (gamestate.whiteToMove and playerOne) or (not gamestate.whiteToMove and playerTwo)
@@ -410,6 +407,9 @@ def play_screen(playerOne, playerTwo, ai_level=None):
                             playerClicks = [squareSelected]
 
             elif e.type == pyg.KEYDOWN:
+                if e.key in (pyg.K_z, pyg.K_r):  # the position changes, drop the AI's search or ponder
+                    aiWorker.cancel()
+                    aiThinking = False
                 if e.key == pyg.K_z:
                     gamestate.undoMove()
                     moveMade = True
@@ -424,33 +424,48 @@ def play_screen(playerOne, playerTwo, ai_level=None):
                     animate = False
                     gameOver = False
         # AI MOVES
-        if not gameOver and not isHumanTurn:
-            if ai_level == 'easy':
-                AIMove = MoveAI.findBestMove(gamestate, validMoves)
-            elif ai_level == 'medium':
-                AIMove = MoveAI.findBestMove2(gamestate, validMoves)
-            elif ai_level == 'hard':
-                AIMove = stock.findStockfishMove(gamestate, validMoves)
-            if AIMove is None:
-                AIMove = MoveAI.findRandomMove(validMoves)
-            gamestate.makeMove(AIMove)
-            moveMade = True
-            animate = True
+        isHumanTurn = (gamestate.whiteToMove and playerOne) or (not gamestate.whiteToMove and playerTwo)
+        if not gameOver and not isHumanTurn and not moveMade:
+            if not aiThinking:
+                aiWorker.start(gamestate, validMoves, ai_level)
+                aiThinking = True
+            else:
+                finished, AIMove = aiWorker.poll()
+                if finished:
+                    aiThinking = False
+                    if AIMove is None:
+                        AIMove = MoveAI.findRandomMove(validMoves)
+                    gamestate.makeMove(AIMove)
+                    moveMade = True
+                    animate = True
+                    aiMoved = True
         if moveMade:
             if animate:
                 animateMove(gamestate.moveLog[-1], screen, gamestate.board, clock)
             validMoves = gamestate.getValidMoves()
+            if aiMoved and validMoves:  # think on the human's time about the reply the AI expects
+                aiWorker.ponder(gamestate, validMoves, ai_level)
             moveMade = False
             animate = False
+            aiMoved = False
 
         drawGameState(screen, gamestate, validMoves, squareSelected, moveLogFont)
 
-        if gamestate.checkMate or gamestate.staleMate:
+        if gamestate.checkMate or gamestate.isDraw():
             gameOver = True
-            drawEndGameText(screen,
-                            'Stalemate !' if gamestate.staleMate else 'Black wins!, YOU DIED' if gamestate.whiteToMove else 'White wins!, YOU DIED')
+            if gamestate.checkMate:
+                drawEndGameText(screen, 'Black wins!, YOU DIED' if gamestate.whiteToMove else 'White wins!, YOU DIED')
+            elif gamestate.staleMate:
+                drawEndGameText(screen, 'Stalemate !')
+            elif gamestate.threefoldRepetition:
+                drawEndGameText(screen, 'Draw by repetition')
+            elif gamestate.fiftyMoveRule:
+                drawEndGameText(screen, 'Draw by the fifty-move rule')
+            else:
+                drawEndGameText(screen, 'Draw, insufficient material')
         clock.tick(60)
         pyg.display.flip()
+    aiWorker.shutdown()
 
 
 # Main menu loop
@@ -503,7 +518,12 @@ def main_menu():
 
 
 if __name__ == "__main__":
+    # Initializing Pygame window, only in the main process so AI worker processes never open one
+    pyg.init()
+    screen = pyg.display.set_mode((768, 512))
+    clock = pyg.time.Clock()
+    pyg.display.set_caption("ChessAI")
     loadImages()
     main_menu()
 
-pyg.quit()
+    pyg.quit()
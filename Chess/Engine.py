@@ -4,9 +4,59 @@
     it determines valid moves including special moves and contains the logs
 """
 
+from array import array
+from Chess import Bitboard, Zobrist
+
+"""
+CONSTANTS
+"""
+
+MAILBOX = "mailbox"
+BITBOARD = "bitboard"
+BACKENDS = (MAILBOX, BITBOARD)
+DEFAULT_BACKEND = BITBOARD  # about 2-3x the move generation speed, the mailbox generator is kept to check it against
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ORTHOGONAL_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+DIAGONAL_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def squareTable(offsets):
+    return [[[(r + dr, c + dc) for dr, dc in offsets if 0 <= r + dr < 8 and 0 <= c + dc < 8]
+             for c in range(8)] for r in range(8)]
+
+
+def rayTable(directions):
+    return [[[[(r + dr * i, c + dc * i) for i in range(1, 8) if 0 <= r + dr * i < 8 and 0 <= c + dc * i < 8]
+              for dr, dc in directions] for c in range(8)] for r in range(8)]
+
+
+# precomputed target squares for every square, e.g: KNIGHT_SQUARES[r][c] lists the knight jumps from (r, c)
+KNIGHT_SQUARES = squareTable(KNIGHT_OFFSETS)
+KING_SQUARES = squareTable(KING_OFFSETS)
+# squares attacked by a pawn of the given color standing on (r, c)
+PAWN_ATTACK_SQUARES = {'w': squareTable(((-1, -1), (-1, 1))), 'b': squareTable(((1, -1), (1, 1)))}
+# squares along each ray leaving (r, c), nearest first
+ORTHOGONAL_RAYS = rayTable(ORTHOGONAL_DIRECTIONS)
+DIAGONAL_RAYS = rayTable(DIAGONAL_DIRECTIONS)
+
+# flags of the packed move code, above the 12 bits of from and to squares
+PROMOTION_FLAG = 1 << 12
+EN_PASSANT_FLAG = 1 << 13
+CASTLE_FLAG = 1 << 14
+CAPTURE_FLAG = 1 << 15
+PIECE_CODES = {"-": 0, "wp": 1, "wR": 2, "wN": 3, "wB": 4, "wQ": 5, "wK": 6,
+               "bp": 7, "bR": 8, "bN": 9, "bB": 10, "bQ": 11, "bK": 12}
+NULL_MOVE = None  # logged in moveLog by makeNullMove
+SEE_VALUES = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 100}  # piece values of the static exchange evaluation
+movePool = {}  # pool key (squares, flags, moved and captured piece) -> Move
+
 
 class GameState():
-    def __init__(self, board=None):
+    def __init__(self, board=None, backend=DEFAULT_BACKEND):
         # the board is a list of lists where each list represents a rank
         if board is None:
             self.board = [
@@ -21,6 +71,17 @@ class GameState():
             ]
         else:
             self.board = board
+        # FEN of the position the move log starts from, unknown (None) for a custom board until gameStateFromFen sets it
+        self.startFen = START_FEN if board is None else None
+
+        # the board list is always kept up to date for the UI and evaluation, the bitboard backend mirrors it
+        # and generates the moves, attacks and exchanges on the integers
+        if backend not in BACKENDS:
+            raise ValueError("unknown board backend: " + str(backend))
+        self.backend = backend
+        self.bitboards = Bitboard.BitboardBoard(self.board) if backend == BITBOARD else None
+        self.attackMaps = {}  # attack maps of the current position by color, dropped on every move
+        self.evaluator = None  # optional incremental evaluation told about every move, see MoveAI.IncrementalEvaluator
 
         self.moveFunctions = {'p': self.getPawnMoves, 'R': self.getRookMoves,
                               'N': self.getKnightMoves, 'B': self.getBishopMoves,
@@ -32,17 +93,32 @@ class GameState():
         self.blackKingLocation = (0, 4)
         self.checkMate = False
         self.staleMate = False
+        # draw flags, set by getValidMoves like checkMate and staleMate (when the side to move still has moves)
+        self.threefoldRepetition = False
+        self.fiftyMoveRule = False
+        self.insufficientMaterial = self.hasInsufficientMaterial()  # kept up to date by makeMove/undoMove
+        self.pieceCount = sum(piece != "-" for row in self.board for piece in row)  # kings included, for the tablebase
+        self.halfmoveClock = 0  # halfmoves since the last capture or pawn move
+        self.halfmoveClockLog = [self.halfmoveClock]
         self.enPassantPossible = ()
         self.enPassantPossibleLog = [self.enPassantPossible]
         self.currentCastlingRight = CastleRights(True, True, True, True)
         self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
                                              self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        # 64-bit position key, updated incrementally by makeMove/undoMove, with one log entry per position
+        self.zobristKey = Zobrist.hashPosition(self)
+        self.zobristLog = [self.zobristKey]
+        # position key -> number of times it occurred in the game, for O(1) repetition checks
+        self.positionCounts = {self.zobristKey: 1}
 
     """ 
     Method that takes a move as a param, checks for validity and executes 
     """
 
     def makeMove(self, move):
+        # xor out the old castling rights and en passant file, the new ones are xor-ed in at the end
+        key = self.zobristKey ^ Zobrist.movePiecesKey(move) ^ Zobrist.BLACK_TO_MOVE_KEY
+        key ^= Zobrist.castlingKey(self.currentCastlingRight) ^ Zobrist.enPassantKey(self)
         self.board[move.startRow][move.startCol] = "-"  # emptying the starting square
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)  # logging da moves
@@ -79,13 +155,33 @@ class GameState():
         self.updateCastleRights(move)
         self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
                                                  self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        if self.bitboards is not None:
+            self.bitboards.makeMove(move)
+        if self.evaluator is not None:
+            self.evaluator.makeMove(move)
+        self.attackMaps = {}
+        self.zobristKey = key ^ Zobrist.castlingKey(self.currentCastlingRight) ^ Zobrist.enPassantKey(self)
+        self.zobristLog.append(self.zobristKey)
+        self.positionCounts[self.zobristKey] = self.positionCounts.get(self.zobristKey, 0) + 1
+        # fifty-move rule and insufficient material: only captures and pawn moves reset the clock or remove material
+        if move.isCapture:
+            self.halfmoveClock = 0
+            self.pieceCount -= 1
+            self.insufficientMaterial = self.hasInsufficientMaterial()
+        elif move.pieceMoved[1] == 'p':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
 
     """
     Method that undoes the previous move
     """
 
     def undoMove(self):
-        if len(self.moveLog) != 0:
+        if len(self.moveLog) != 0 and self.moveLog[-1] is NULL_MOVE:
+            self.undoNullMove()
+        elif len(self.moveLog) != 0:
             move = self.moveLog.pop()
             self.board[move.startRow][move.startCol] = move.pieceMoved
             self.board[move.endRow][move.endCol] = move.pieceCaptured
@@ -111,9 +207,76 @@ class GameState():
                     self.board[move.endRow][move.endCol + 1] = "-"
             # undoing castling rights
             self.castleRightsLog.pop()  # get rid of new castle rights from undone move
-            self.currentCastlingRight = self.castleRightsLog[-1]  # set curr castling rights to most recent one
+            # set curr castling rights to a copy of the most recent one so later moves can't rewrite the log
+            lastRights = self.castleRightsLog[-1]
+            self.currentCastlingRight = CastleRights(lastRights.wks, lastRights.bks, lastRights.wqs, lastRights.bqs)
+            if self.bitboards is not None:
+                self.bitboards.undoMove(move)
+            if self.evaluator is not None:
+                self.evaluator.undoMove(move)
+            self.attackMaps = {}
+            count = self.positionCounts[self.zobristKey]
+            if count == 1:
+                del self.positionCounts[self.zobristKey]
+            else:
+                self.positionCounts[self.zobristKey] = count - 1
+            self.zobristLog.pop()
+            self.zobristKey = self.zobristLog[-1]
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            if move.isCapture:
+                self.pieceCount += 1
+                self.insufficientMaterial = self.hasInsufficientMaterial()
             self.checkMate = False
             self.staleMate = False
+            self.threefoldRepetition = False
+            self.fiftyMoveRule = False
+
+    """
+    Method to pass the turn without moving, for the null-move pruning of the search
+    - logged as NULL_MOVE so undoMove takes it back like any move, never make it while in check
+    - the position is left out of the repetition counts, it can't happen in a game
+    """
+
+    def makeNullMove(self):
+        self.zobristKey ^= Zobrist.BLACK_TO_MOVE_KEY ^ Zobrist.enPassantKey(self)
+        self.moveLog.append(NULL_MOVE)
+        self.whiteToMove = not self.whiteToMove
+        self.enPassantPossible = ()
+        self.enPassantPossibleLog.append(self.enPassantPossible)
+        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
+                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        self.zobristLog.append(self.zobristKey)
+        self.halfmoveClock += 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+
+    def undoNullMove(self):
+        self.moveLog.pop()
+        self.whiteToMove = not self.whiteToMove
+        self.enPassantPossibleLog.pop()
+        self.enPassantPossible = self.enPassantPossibleLog[-1]
+        self.castleRightsLog.pop()
+        self.zobristLog.pop()
+        self.zobristKey = self.zobristLog[-1]
+        self.halfmoveClockLog.pop()
+        self.halfmoveClock = self.halfmoveClockLog[-1]
+        self.checkMate = False
+        self.staleMate = False
+        self.threefoldRepetition = False
+        self.fiftyMoveRule = False
+
+    """
+    Helper method to check whether the side to move has a piece other than pawns and its king,
+    without one passing is often the best move (zugzwang) and null-move pruning can't be trusted
+    """
+
+    def hasNonPawnMaterial(self):
+        color = 'w' if self.whiteToMove else 'b'
+        for row in self.board:
+            for piece in row:
+                if piece[0] == color and piece[1] not in ('p', 'K'):
+                    return True
+        return False
 
     """
     Helper method to update the castling rights after a move is made
@@ -144,7 +307,7 @@ class GameState():
                 if move.endCol == 0:
                     self.currentCastlingRight.wqs = False
                 elif move.endCol == 7:
-                    self.currentCastlingRight.wks
+                    self.currentCastlingRight.wks = False
         elif move.pieceCaptured == 'bR':
             if move.endRow == 0:
                 if move.endCol == 0:
@@ -152,14 +315,135 @@ class GameState():
                 elif move.endCol == 7:
                     self.currentCastlingRight.bks = False
 
-    """ 
-    Method to find all valid moves when there's a check,
-    e.g: get all white's possible moves then generate 
-    black's moves in the position, if any result in a 
-    check, we unvalidate them
+    """
+    Method to get how many times the current position occurred in the game (including now), in O(1):
+    positions before a capture, pawn move or castling rights change can't come back, so counting every key is exact
+    """
+
+    def repetitionCount(self):
+        return self.positionCounts.get(self.zobristKey, 0)
+
+    """
+    Method to check whether neither side has the material to checkmate:
+    king against king, king and one minor piece against king, or only bishops all on squares of one color
+    """
+
+    def hasInsufficientMaterial(self):
+        minorPieces = []
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "-" and piece[1] != 'K':
+                    if piece[1] not in ('N', 'B'):
+                        return False
+                    minorPieces.append((piece[1], (r + c) % 2))
+        if len(minorPieces) <= 1:
+            return True
+        return all(piece == 'B' and color == minorPieces[0][1] for piece, color in minorPieces)
+
+    """
+    Method to check whether the game is drawn, the flags are set by getValidMoves
+    """
+
+    def isDraw(self):
+        return self.staleMate or self.threefoldRepetition or self.fiftyMoveRule or self.insufficientMaterial
+
+    """
+    Helper method to set the draw flags once the valid moves are known, checkmate comes before the fifty-move rule
+    """
+
+    def updateDrawFlags(self, hasMoves):
+        self.threefoldRepetition = hasMoves and self.positionCounts.get(self.zobristKey, 0) >= 3
+        self.fiftyMoveRule = hasMoves and self.halfmoveClock >= 100
+
+    """
+    Method to get a compact, picklable form of the game: (start FEN, array of 16-bit move codes),
+    gameStateFromHistory turns it back into a GameState, e.g: in another process
+    """
+
+    def serialize(self):
+        if self.startFen is None:
+            raise ValueError("the start position of this game is unknown")
+        return self.startFen, array('H', [move.code for move in self.moveLog])
+
+    """
+    Method to find all valid moves without making them: checkForPinsAndChecks scans out from the king once,
+    then pinned pieces may only slide along their pin, in single check a move has to capture or block the checker,
+    in double check only the king moves, king moves are kept when kingMoveIsSafe and en passant when enPassantIsSafe
     """
 
     def getValidMoves(self):
+        if self.bitboards is not None:  # the same rules worked out on the integers, see BitboardBoard.getValidMoves
+            legalMoves, inCheck = self.bitboards.getValidMoves(self)
+            if len(legalMoves) == 0:
+                if inCheck:
+                    self.checkMate = True
+                else:
+                    self.staleMate = True
+            self.updateDrawFlags(len(legalMoves) != 0)
+            return legalMoves
+        tempEnPassantPossible = self.enPassantPossible
+        tempCastlingRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
+                                          self.currentCastlingRight.wqs, self.currentCastlingRight.bqs, )
+        inCheck, pins, checks = self.checkForPinsAndChecks()
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        moves = self.getAllMoves()  # all possible moves
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, moves)
+
+        pinDirections = {(pin[0], pin[1]): (pin[2], pin[3]) for pin in pins}
+        validSquares = None
+        if len(checks) == 1:  # block the check or capture the checker
+            checkRow, checkCol, dirRow, dirCol = checks[0]
+            if self.board[checkRow][checkCol][1] == 'N':  # knights can't be blocked
+                validSquares = {(checkRow, checkCol)}
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    validSquares.add((kingRow + dirRow * i, kingCol + dirCol * i))
+                    if (kingRow + dirRow * i, kingCol + dirCol * i) == (checkRow, checkCol):
+                        break
+
+        legalMoves = []
+        for move in moves:
+            if move.pieceMoved[1] == 'K':
+                if move.isCastleMove or self.kingMoveIsSafe(move):
+                    legalMoves.append(move)
+                continue
+            if len(checks) > 1:  # double check, only the king can move
+                continue
+            pin = pinDirections.get((move.startRow, move.startCol))
+            if pin is not None and (move.endRow - kingRow) * pin[1] != (move.endCol - kingCol) * pin[0]:
+                continue  # pinned pieces can only slide along the pin
+            if move.isEnPassantMove:
+                # both pawns leave the rank at once which can uncover a check no pin scan sees
+                if self.enPassantIsSafe(move):
+                    legalMoves.append(move)
+            elif validSquares is None or (move.endRow, move.endCol) in validSquares:
+                legalMoves.append(move)
+
+        if len(legalMoves) == 0:  # checkmate / stalemate
+            if inCheck:
+                self.checkMate = True
+            else:
+                self.staleMate = True
+        self.updateDrawFlags(len(legalMoves) != 0)
+
+        self.enPassantPossible = tempEnPassantPossible
+        self.currentCastlingRight = tempCastlingRights
+        return legalMoves
+
+    """
+    Method to find all valid moves the slow way, kept as a reference to verify getValidMoves against,
+    e.g: get all white's possible moves then generate
+    black's moves in the position, if any result in a
+    check, we unvalidate them
+    """
+
+    def getValidMovesByFiltering(self):
         tempEnPassantPossible = self.enPassantPossible
         tempCastlingRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
                                           self.currentCastlingRight.wqs, self.currentCastlingRight.bqs, )
@@ -169,23 +453,117 @@ class GameState():
         else:
             self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
 
-        for i in range(len(moves) - 1, -1, -1):  # go backwards when removing from a list
-            self.makeMove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])  # not a valid move if the kings in check
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
+        if self.bitboards is not None:  # legality test on the bitboards alone
+            moves = [move for move in moves if self.bitboards.leavesKingSafe(move)]
+        else:
+            self.filterIllegalMoves(moves)
         if len(moves) == 0:  # checkmate / stalemate
             if self.inCheck():
                 self.checkMate = True
             else:
                 self.staleMate = True
+        self.updateDrawFlags(len(moves) != 0)
 
         self.enPassantPossible = tempEnPassantPossible
         self.currentCastlingRight = tempCastlingRights
         return moves
 
+    """
+    Method to find the pieces pinned to the side to move's king and the pieces giving check,
+    scanning once outwards from the king square
+    - pins and checks are lists of (row, col, dirRow, dirCol), the direction pointing away from the king
+    """
+
+    def checkForPinsAndChecks(self):
+        pins = []
+        checks = []
+        inCheck = False
+        if self.whiteToMove:
+            enemyColor, allyColor = "b", "w"
+            startRow, startCol = self.whiteKingLocation
+        else:
+            enemyColor, allyColor = "w", "b"
+            startRow, startCol = self.blackKingLocation
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            d = directions[j]
+            possiblePin = ()
+            for i in range(1, 8):
+                endRow = startRow + d[0] * i
+                endCol = startCol + d[1] * i
+                if 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = self.board[endRow][endCol]
+                    if endPiece[0] == allyColor:
+                        if possiblePin == ():  # first allied piece could be pinned
+                            possiblePin = (endRow, endCol, d[0], d[1])
+                        else:  # second allied piece, so no pin or check in this direction
+                            break
+                    elif endPiece[0] == enemyColor:
+                        pieceType = endPiece[1]
+                        # orthogonal rooks, diagonal bishops, queens anywhere, and adjacent pawns or kings
+                        if (0 <= j <= 3 and pieceType == 'R') or (4 <= j <= 7 and pieceType == 'B') or \
+                                (i == 1 and pieceType == 'p' and (
+                                        (enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
+                                pieceType == 'Q' or (i == 1 and pieceType == 'K'):
+                            if possiblePin == ():  # no piece blocking, so check
+                                inCheck = True
+                                checks.append((endRow, endCol, d[0], d[1]))
+                            else:  # piece blocking, so pin
+                                pins.append(possiblePin)
+                        break  # enemy piece not applying check or pin
+                else:  # off board
+                    break
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        for m in knightMoves:
+            endRow = startRow + m[0]
+            endCol = startCol + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                if self.board[endRow][endCol] == enemyColor + 'N':
+                    inCheck = True
+                    checks.append((endRow, endCol, m[0], m[1]))
+        return inCheck, pins, checks
+
+    """
+    Helper method to determine if the king can step to the end square of the move,
+    the king is lifted first so sliders see through its old square
+    """
+
+    def kingMoveIsSafe(self, move):
+        if self.bitboards is not None:
+            return self.bitboards.kingMoveIsSafe(move)
+        self.board[move.startRow][move.startCol] = "-"
+        attacked = self.squareAttackedBy(move.endRow, move.endCol, 'b' if self.whiteToMove else 'w')
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        return not attacked
+
+    """
+    Helper method to determine if an en passant capture leaves our king safe
+    """
+
+    def enPassantIsSafe(self, move):
+        if self.bitboards is not None:
+            return self.bitboards.leavesKingSafe(move)
+        self.makeMove(move)
+        self.whiteToMove = not self.whiteToMove
+        safe = not self.inCheck()
+        self.whiteToMove = not self.whiteToMove
+        self.undoMove()
+        return safe
+
+    """
+    Helper method to remove the moves that leave our king in check
+    by making each move and looking for attacks on the king
+    """
+
+    def filterIllegalMoves(self, moves):
+        for i in range(len(moves) - 1, -1, -1):  # go backwards when removing from a list
+            self.makeMove(moves[i])
+            self.whiteToMove = not self.whiteToMove
+            if self.inCheck():
+                moves.remove(moves[i])  # not a valid move if the kings in check
+            self.whiteToMove = not self.whiteToMove
+            self.undoMove()
+
     """ 
     Method to determine if a player in check
     """
@@ -201,19 +579,95 @@ class GameState():
     """
 
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove
-        oppMoves = self.getAllMoves()
-        self.whiteToMove = not self.whiteToMove
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        attackMap = self.attackMaps.get(enemyColor)
+        if attackMap is not None:
+            return attackMap[r][c] > 0
+        if self.bitboards is not None:
+            return self.bitboards.squareAttacked(r * 8 + c, enemyColor)
+        return self.squareAttackedBy(r, c, enemyColor)
+
+    """
+    Method to determine if any piece of the given color attacks the square,
+    looking outwards from the square along the precomputed knight, king, pawn and slider tables
+    """
+
+    def squareAttackedBy(self, r, c, color):
+        board = self.board
+        knight = color + 'N'
+        for endRow, endCol in KNIGHT_SQUARES[r][c]:
+            if board[endRow][endCol] == knight:
+                return True
+        king = color + 'K'
+        for endRow, endCol in KING_SQUARES[r][c]:
+            if board[endRow][endCol] == king:
                 return True
+        # a pawn of this color attacks (r, c) exactly when a pawn of the other color on (r, c) would attack it back
+        pawn = color + 'p'
+        for endRow, endCol in PAWN_ATTACK_SQUARES['b' if color == 'w' else 'w'][r][c]:
+            if board[endRow][endCol] == pawn:
+                return True
+        queen = color + 'Q'
+        for sliders, rays in (((color + 'R', queen), ORTHOGONAL_RAYS[r][c]), ((color + 'B', queen), DIAGONAL_RAYS[r][c])):
+            for ray in rays:
+                for endRow, endCol in ray:
+                    endPiece = board[endRow][endCol]
+                    if endPiece != "-":
+                        if endPiece in sliders:
+                            return True
+                        break
         return False
 
+    """
+    Method to get the number of pieces of the given color attacking every square,
+    the map is computed once per position and cached until the next move
+    """
+
+    def getAttackMap(self, color):
+        attackMap = self.attackMaps.get(color)
+        if attackMap is not None:
+            return attackMap
+        if self.bitboards is not None:
+            attackMap = self.attackMaps[color] = self.bitboards.attackCounts(color)
+            return attackMap
+        attackMap = [[0] * 8 for _ in range(8)]
+        board = self.board
+        for r in range(8):
+            for c in range(8):
+                piece = board[r][c]
+                if piece[0] != color:
+                    continue
+                pieceType = piece[1]
+                if pieceType == 'p':
+                    targets = PAWN_ATTACK_SQUARES[color][r][c]
+                elif pieceType == 'N':
+                    targets = KNIGHT_SQUARES[r][c]
+                elif pieceType == 'K':
+                    targets = KING_SQUARES[r][c]
+                else:
+                    targets = []
+                    rays = []
+                    if pieceType in ('R', 'Q'):
+                        rays += ORTHOGONAL_RAYS[r][c]
+                    if pieceType in ('B', 'Q'):
+                        rays += DIAGONAL_RAYS[r][c]
+                    for ray in rays:
+                        for endRow, endCol in ray:
+                            targets.append((endRow, endCol))
+                            if board[endRow][endCol] != "-":  # the blocker is attacked (or defended) too
+                                break
+                for endRow, endCol in targets:
+                    attackMap[endRow][endCol] += 1
+        self.attackMaps[color] = attackMap
+        return attackMap
+
     """ 
     Method to find all moves when there's no check
     """
 
     def getAllMoves(self):
+        if self.bitboards is not None:
+            return self.bitboards.getAllMoves(self)
         moves = []
         for r in range(len(self.board)):
             for c in range(len(self.board[r])):
@@ -223,6 +677,154 @@ class GameState():
                     self.moveFunctions[piece](r, c, moves)  #
         return moves
 
+    """
+    Method to generate the captures and promotions of the side to move, for the quiescence search
+    - the moves are pseudo-legal: they can leave the own king in check, see kingLeftInCheck,
+      so legality is only paid for the moves actually searched
+    - no flags (checkMate, staleMate...) are touched
+    """
+
+    def getCaptureMoves(self):
+        if self.bitboards is not None:
+            return self.bitboards.getCaptureMoves(self)
+        board = self.board
+        ally, enemy = ('w', 'b') if self.whiteToMove else ('b', 'w')
+        lastRow = 0 if self.whiteToMove else 7
+        forward = -1 if self.whiteToMove else 1
+        moves = []
+        for r in range(8):
+            row = board[r]
+            for c in range(8):
+                piece = row[c]
+                if piece[0] != ally:
+                    continue
+                kind = piece[1]
+                if kind == 'p':
+                    for endRow, endCol in PAWN_ATTACK_SQUARES[ally][r][c]:
+                        if board[endRow][endCol][0] == enemy:
+                            moves.append(getMove((r, c), (endRow, endCol), board))
+                        elif (endRow, endCol) == self.enPassantPossible:
+                            moves.append(getMove((r, c), (endRow, endCol), board, isEnPassantMove=True))
+                    if r + forward == lastRow and board[lastRow][c] == "-":  # promotion push
+                        moves.append(getMove((r, c), (lastRow, c), board))
+                elif kind == 'N' or kind == 'K':
+                    for endRow, endCol in (KNIGHT_SQUARES if kind == 'N' else KING_SQUARES)[r][c]:
+                        if board[endRow][endCol][0] == enemy:
+                            moves.append(getMove((r, c), (endRow, endCol), board))
+                else:
+                    if kind == 'R':
+                        rays = ORTHOGONAL_RAYS[r][c]
+                    elif kind == 'B':
+                        rays = DIAGONAL_RAYS[r][c]
+                    else:
+                        rays = ORTHOGONAL_RAYS[r][c] + DIAGONAL_RAYS[r][c]
+                    for ray in rays:
+                        for endRow, endCol in ray:
+                            endPiece = board[endRow][endCol]
+                            if endPiece != "-":
+                                if endPiece[0] == enemy:
+                                    moves.append(getMove((r, c), (endRow, endCol), board))
+                                break
+        return moves
+
+    """
+    Method to get the static exchange evaluation of a capture: the material the moving side wins (in SEE_VALUES)
+    once both sides have taken on the target square as long as it pays, cheapest attacker first
+    - attackers hidden behind a slider or pawn on the same line (x-rays) join in once the piece in front has taken
+    - the board is only read, nothing is moved
+    """
+
+    def see(self, move):
+        if self.bitboards is not None:
+            return self.bitboards.see(move)
+        board = self.board
+        r, c = move.endRow, move.endCol
+        start = (move.startRow, move.startCol)
+        # every line into the target square is a queue of (value, color), the piece nearest to the square first
+        lines = []
+        knights = {'w': [], 'b': []}
+        for endRow, endCol in KNIGHT_SQUARES[r][c]:
+            piece = board[endRow][endCol]
+            if piece in ('wN', 'bN') and (endRow, endCol) != start:
+                knights[piece[0]].append(SEE_VALUES['N'])
+        for rays, sliders, diagonal in ((ORTHOGONAL_RAYS[r][c], ('R', 'Q'), False),
+                                        (DIAGONAL_RAYS[r][c], ('B', 'Q'), True)):
+            for ray in rays:
+                line = []
+                for distance, (endRow, endCol) in enumerate(ray, 1):
+                    piece = board[endRow][endCol]
+                    if piece == "-" or (endRow, endCol) == start:  # the moving piece has left its square
+                        continue
+                    kind = piece[1]
+                    if kind in sliders:
+                        line.append((SEE_VALUES[kind], piece[0]))
+                    elif distance == 1 and not line and (kind == 'K' or (
+                            diagonal and kind == 'p' and (endRow > r) == (piece[0] == 'w'))):
+                        line.append((SEE_VALUES[kind], piece[0]))
+                    else:
+                        break
+                if line:
+                    line.reverse()  # popped from the end
+                    lines.append(line)
+
+        if move.isPawnPromotion:
+            gains = [SEE_VALUES[move.pieceCaptured[1]] + SEE_VALUES['Q'] - SEE_VALUES['p']
+                     if move.isCapture else SEE_VALUES['Q'] - SEE_VALUES['p']]
+            onSquare = SEE_VALUES['Q']
+        else:
+            gains = [SEE_VALUES[move.pieceCaptured[1]] if move.isCapture else 0]
+            onSquare = SEE_VALUES[move.pieceMoved[1]]
+        side = 'b' if move.pieceMoved[0] == 'w' else 'w'
+        while True:
+            attacker = self.cheapestAttacker(side, lines, knights)
+            if attacker is None:
+                break
+            if attacker == SEE_VALUES['K'] and \
+                    self.cheapestAttacker('b' if side == 'w' else 'w', lines, knights, take=False) is not None:
+                break  # the king can't take a defended piece
+            gains.append(onSquare - gains[-1])
+            onSquare = attacker
+            side = 'b' if side == 'w' else 'w'
+        # each side may stop taking when going on would lose, so back the gains up from the end
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+        return gains[0]
+
+    """
+    Helper method for see: the value of the cheapest piece of color that can capture next, None when there is none
+    - with take the piece is also removed from its line, uncovering the x-ray behind it
+    """
+
+    @staticmethod
+    def cheapestAttacker(color, lines, knights, take=True):
+        best = None
+        bestValue = knights[color][-1] if knights[color] else None
+        for line in lines:
+            value, pieceColor = line[-1]
+            if pieceColor == color and (bestValue is None or value < bestValue):
+                best = line
+                bestValue = value
+        if bestValue is None or not take:
+            return bestValue
+        if best is None:
+            knights[color].pop()
+        else:
+            best.pop()
+            if not best:
+                lines.remove(best)
+        return bestValue
+
+    """
+    Method to call right after making a pseudo-legal move: whether it left the mover's king attacked (illegal)
+    """
+
+    def kingLeftInCheck(self):
+        color = 'b' if self.whiteToMove else 'w'
+        if self.bitboards is not None:
+            return self.bitboards.kingAttacked(color)
+        kingRow, kingCol = self.blackKingLocation if self.whiteToMove else self.whiteKingLocation
+        return self.squareAttackedBy(kingRow, kingCol, 'w' if self.whiteToMove else 'b')
+
     """
     Method to manage the pawn moves
     """
@@ -230,35 +832,35 @@ class GameState():
     def getPawnMoves(self, r, c, moves):
         if self.whiteToMove:  # white pawns
             if self.board[r - 1][c] == "-":  # 1 square bawn move
-                moves.append(Move((r, c), (r - 1, c), self.board))
+                moves.append(getMove((r, c), (r - 1, c), self.board))
                 if r == 6 and self.board[r - 2][c] == "-":  # 2 square bawn move
-                    moves.append(Move((r, c), (r - 2, c), self.board))
+                    moves.append(getMove((r, c), (r - 2, c), self.board))
             if c - 1 >= 0:  # remove this if to make a funny bug
                 if self.board[r - 1][c - 1][0] == 'b':
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
+                    moves.append(getMove((r, c), (r - 1, c - 1), self.board))
                 elif (r - 1, c - 1) == self.enPassantPossible:
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board, isEnPassantMove=True))
+                    moves.append(getMove((r, c), (r - 1, c - 1), self.board, isEnPassantMove=True))
 
             if c + 1 <= 7:
                 if self.board[r - 1][c + 1][0] == 'b':
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
+                    moves.append(getMove((r, c), (r - 1, c + 1), self.board))
                 elif (r - 1, c + 1) == self.enPassantPossible:
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board, isEnPassantMove=True))
+                    moves.append(getMove((r, c), (r - 1, c + 1), self.board, isEnPassantMove=True))
         else:  # black pawns
             if self.board[r + 1][c] == "-":  # 1 square bawn move
-                moves.append(Move((r, c), (r + 1, c), self.board))
+                moves.append(getMove((r, c), (r + 1, c), self.board))
                 if r == 1 and self.board[r + 2][c] == "-":  # 2 square bawn move
-                    moves.append(Move((r, c), (r + 2, c), self.board))
+                    moves.append(getMove((r, c), (r + 2, c), self.board))
             if c - 1 >= 0:
                 if self.board[r + 1][c - 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
+                    moves.append(getMove((r, c), (r + 1, c - 1), self.board))
                 elif (r + 1, c - 1) == self.enPassantPossible:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, isEnPassantMove=True))
+                    moves.append(getMove((r, c), (r + 1, c - 1), self.board, isEnPassantMove=True))
             if c + 1 <= 7:
                 if self.board[r + 1][c + 1][0] == 'w':
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
+                    moves.append(getMove((r, c), (r + 1, c + 1), self.board))
                 elif (r + 1, c + 1) == self.enPassantPossible:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, isEnPassantMove=True))
+                    moves.append(getMove((r, c), (r + 1, c + 1), self.board, isEnPassantMove=True))
 
     """
     Method to manage the rook moves
@@ -274,9 +876,9 @@ class GameState():
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
                     endPiece = self.board[endRow][endCol]
                     if endPiece == "-":
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        moves.append(getMove((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        moves.append(getMove((r, c), (endRow, endCol), self.board))
                         break
                     else:  # invalid piece
                         break
@@ -297,7 +899,7 @@ class GameState():
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
                 if endPiece[0] != allyColor:
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                    moves.append(getMove((r, c), (endRow, endCol), self.board))
 
     """
     Method to manage the bishop moves
@@ -314,9 +916,9 @@ class GameState():
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
                     endPiece = self.board[endRow][endCol]
                     if endPiece == "-":
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        moves.append(getMove((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        moves.append(getMove((r, c), (endRow, endCol), self.board))
                         break
                     else:  # invalid piece
                         break
@@ -345,7 +947,7 @@ class GameState():
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
                 if endPiece[0] != allyColor:
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                    moves.append(getMove((r, c), (endRow, endCol), self.board))
 
     """
     Method to generate all valid castle moves
@@ -369,7 +971,7 @@ class GameState():
     def getKingsideCastleMoves(self, r, c, moves):
         if self.board[r][c + 1] == "-" and self.board[r][c + 2] == "-":
             if not self.squareUnderAttack(r, c + 1) and not self.squareUnderAttack(r, c + 2):
-                moves.append(Move((r, c), (r, c + 2), self.board, isCastleMove=True))
+                moves.append(getMove((r, c), (r, c + 2), self.board, isCastleMove=True))
 
     """
     Helper method to generate queenside castle moves
@@ -378,7 +980,65 @@ class GameState():
     def getQueensideCastleMoves(self, r, c, moves):
         if self.board[r][c - 1] == "-" and self.board[r][c - 2] == "-" and self.board[r][c - 3] == "-":
             if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
-                moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove=True))
+                moves.append(getMove((r, c), (r, c - 2), self.board, isCastleMove=True))
+
+
+"""
+Method to build a game state from a FEN string
+"""
+
+
+def gameStateFromFen(fen, backend=DEFAULT_BACKEND):
+    fenToPiece = {"r": "bR", "n": "bN", "b": "bB", "q": "bQ", "k": "bK", "p": "bp",
+                  "R": "wR", "N": "wN", "B": "wB", "Q": "wQ", "K": "wK", "P": "wp"}
+    fields = fen.split()
+    board = []
+    for rank in fields[0].split("/"):
+        row = []
+        for char in rank:
+            if char.isdigit():
+                row += ["-"] * int(char)
+            else:
+                row.append(fenToPiece[char])
+        board.append(row)
+    if len(board) != 8 or any(len(row) != 8 for row in board):
+        raise ValueError("invalid FEN board: " + fields[0])
+
+    gamestate = GameState(board, backend)
+    gamestate.whiteToMove = len(fields) < 2 or fields[1] == "w"
+    for r in range(8):
+        for c in range(8):
+            if board[r][c] == "wK":
+                gamestate.whiteKingLocation = (r, c)
+            elif board[r][c] == "bK":
+                gamestate.blackKingLocation = (r, c)
+    castling = fields[2] if len(fields) > 2 else "-"
+    gamestate.currentCastlingRight = CastleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling)
+    gamestate.castleRightsLog = [CastleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling)]
+    if len(fields) > 3 and fields[3] != "-":
+        gamestate.enPassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+    gamestate.enPassantPossibleLog = [gamestate.enPassantPossible]
+    gamestate.zobristKey = Zobrist.hashPosition(gamestate)
+    gamestate.zobristLog = [gamestate.zobristKey]
+    gamestate.positionCounts = {gamestate.zobristKey: 1}
+    gamestate.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+    gamestate.halfmoveClockLog = [gamestate.halfmoveClock]
+    gamestate.startFen = " ".join(fields + ["w", "-", "-", "0", "1"][len(fields) - 1:]) if len(fields) < 6 else fen
+    return gamestate
+
+
+"""
+Method to rebuild a game from its start FEN and the codes of the moves played (see GameState.serialize)
+"""
+
+
+def gameStateFromHistory(startFen, moveCodes, backend=DEFAULT_BACKEND):
+    gamestate = gameStateFromFen(startFen, backend)
+    for code in moveCodes:
+        start, end = code >> 6 & 63, code & 63
+        gamestate.makeMove(getMove(divmod(start, 8), divmod(end, 8), gamestate.board,
+                                   bool(code & EN_PASSANT_FLAG), bool(code & CASTLE_FLAG)))
+    return gamestate
 
 
 class CastleRights():
@@ -389,7 +1049,29 @@ class CastleRights():
         self.bqs = bqs
 
 
+"""
+Method to get the move from startSquare to endSquare on the board out of the move pool,
+moves never change once built so every generator shares one Move object per distinct move
+instead of allocating a new one each time
+"""
+
+
+def getMove(startSquare, endSquare, board, isEnPassantMove=False, isCastleMove=False):
+    startRow, startCol = startSquare
+    endRow, endCol = endSquare
+    key = (startRow << 9 | startCol << 6 | endRow << 3 | endCol | isEnPassantMove << 12 | isCastleMove << 13 |
+           PIECE_CODES[board[startRow][startCol]] << 14 | PIECE_CODES[board[endRow][endCol]] << 18)
+    move = movePool.get(key)
+    if move is None:
+        move = movePool[key] = Move(startSquare, endSquare, board, isEnPassantMove, isCastleMove)
+    return move
+
+
 class Move():
+    # the move is packed into a 16-bit code: to square (bits 0-5), from square (6-11) and flags (12-15)
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'isPawnPromotion',
+                 'isEnPassantMove', 'isCastleMove', 'isCapture', 'moveID', 'code')
+
     # dictionaries to map keys to values (key: value)
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
@@ -416,6 +1098,9 @@ class Move():
         self.isCastleMove = isCastleMove
         self.isCapture = self.pieceCaptured != '-'
         self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        self.code = ((self.startRow * 8 + self.startCol) << 6 | (self.endRow * 8 + self.endCol) |
+                     (PROMOTION_FLAG if self.isPawnPromotion else 0) | (EN_PASSANT_FLAG if isEnPassantMove else 0) |
+                     (CASTLE_FLAG if isCastleMove else 0) | (CAPTURE_FLAG if self.isCapture else 0))
 
     def __eq__(self, other):
         if isinstance(other, Move):
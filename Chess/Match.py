@@ -0,0 +1,298 @@
+"""
+This script contains the headless match runner of our engine, no pygame needed
+it plays games between two of our AIs (or stockfish) across a pool of processes,
+streams every finished game to disk as PGN and as a line of results, keeps a W/D/L tally with an Elo estimate,
+and picks up where it stopped when an interrupted run is started again with the same output directory
+
+usage (from the repository root):
+    python -m Chess.Match greedy medium --games 20 --out matches/greedy-medium
+    python -m Chess.Match medium stockfish --games 100 --movetime 0.5 --opening-plies 6 --workers 8
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sys
+import time
+from Chess import Engine, MoveAI, stock
+
+"""
+CONSTANTS
+"""
+
+PLAYERS = ("random", "greedy", "easy", "medium", "stockfish")  # findRandomMove, findGreedyMove, findBestMove, findBestMove2
+MAX_PLIES = 300  # longer games are adjudicated as draws
+OPENING_PLIES = 4  # random plies played from the start position before the engines take over
+RESULTS_FILE = "results.jsonl"  # one JSON line per finished game, also what a resumed run reads back
+PGN_FILE = "games.pgn"
+WHITE_WINS, BLACK_WINS, DRAW = "1-0", "0-1", "1/2-1/2"
+
+"""
+Method to let one of our players choose a move
+- moveTime (seconds) bounds the medium search and stockfish, the other players are fast anyway
+"""
+
+
+def choosePlayerMove(player, gamestate, validMoves, moveTime=None):
+    validMoves = list(validMoves)
+    if player == "random":
+        move = MoveAI.findRandomMove(validMoves)
+    elif player == "greedy":
+        move = MoveAI.findGreedyMove(gamestate, validMoves)
+    elif player == "easy":
+        move = MoveAI.findBestMove(gamestate, validMoves)
+    elif player == "medium":
+        move = MoveAI.findBookMove(gamestate, validMoves)
+        if move is None:
+            random.shuffle(validMoves)
+            move = MoveAI.findBestMoveIterative(gamestate, validMoves, moveTime if moveTime else MoveAI.MAX_TIME)
+    elif player == "stockfish":
+        overrides = {"moveTime": int(moveTime * 1000)} if moveTime else {}
+        move = stock.findStockfishMove(gamestate, validMoves, stock.getStockfishConfig('hard', **overrides))
+    else:
+        raise ValueError("unknown player: " + str(player))
+    return move if move is not None else MoveAI.findRandomMove(validMoves)
+
+
+"""
+Method to get the standard algebraic notation of a move for PGN, e.g: Nbd7, exd6, e8=Q+, O-O#
+- validMoves are the valid moves of the position before the move, used to tell apart pieces going to the same square
+"""
+
+
+def sanMove(gamestate, move, validMoves):
+    if move.isCastleMove:
+        notation = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        endSquare = move.getRankFile(move.endRow, move.endCol)
+        piece = move.pieceMoved[1]
+        if piece == "p":
+            notation = (move.colsToFiles[move.startCol] + "x" if move.isCapture else "") + endSquare
+            if move.isPawnPromotion:
+                notation += "=Q"
+        else:
+            rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other is not move and
+                      other.endRow == move.endRow and other.endCol == move.endCol]
+            disambiguation = ""
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    disambiguation = move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    disambiguation = move.rowsToRanks[move.startRow]
+                else:
+                    disambiguation = move.getRankFile(move.startRow, move.startCol)
+            notation = piece + disambiguation + ("x" if move.isCapture else "") + endSquare
+    gamestate.makeMove(move)
+    if gamestate.inCheck():
+        notation += "#" if not gamestate.getValidMoves() else "+"
+    gamestate.undoMove()
+    return notation
+
+
+"""
+Method to play one game, returns its record (a dict that is saved as one JSON line)
+- the opening is openingPlies random moves chosen from seed, so the same game index always gets the same opening
+"""
+
+
+def playGame(index, white, black, moveTime=None, openingPlies=OPENING_PLIES, seed=0, maxPlies=MAX_PLIES):
+    startTime = time.time()
+    gamestate = Engine.GameState()
+    openingRandom = random.Random(seed * 100003 + index // 2)  # both games of a pair share their opening
+    sanMoves = []
+    players = {True: white, False: black}
+    thinkingTime = {white: 0.0, black: 0.0} if white != black else {white: 0.0}
+    result, termination = None, None
+    while result is None:
+        validMoves = gamestate.getValidMoves()
+        if gamestate.checkMate:
+            result, termination = (BLACK_WINS if gamestate.whiteToMove else WHITE_WINS), "checkmate"
+        elif gamestate.staleMate:
+            result, termination = DRAW, "stalemate"
+        elif gamestate.threefoldRepetition:
+            result, termination = DRAW, "threefold repetition"
+        elif gamestate.fiftyMoveRule:
+            result, termination = DRAW, "fifty-move rule"
+        elif gamestate.insufficientMaterial:
+            result, termination = DRAW, "insufficient material"
+        elif len(gamestate.moveLog) >= maxPlies:
+            result, termination = DRAW, "move limit"
+        if result is not None:
+            break
+        if len(gamestate.moveLog) < openingPlies:
+            move = openingRandom.choice(validMoves)
+        else:
+            player = players[gamestate.whiteToMove]
+            moveStart = time.time()
+            move = choosePlayerMove(player, gamestate, validMoves, moveTime)
+            thinkingTime[player] += time.time() - moveStart
+        sanMoves.append(sanMove(gamestate, move, validMoves))
+        gamestate.makeMove(move)
+    return {"game": index, "date": time.strftime("%Y.%m.%d"), "white": white, "black": black, "result": result,
+            "termination": termination, "plies": len(sanMoves), "moves": sanMoves,
+            "seconds": round(time.time() - startTime, 3),
+            "thinkingTime": {player: round(seconds, 3) for player, seconds in thinkingTime.items()}}
+
+
+"""
+Method to turn a game record into PGN text
+"""
+
+
+def gameToPgn(record, event="ChessAI match"):
+    headers = [("Event", event), ("Site", "?"), ("Date", record.get("date", "????.??.??")),
+               ("Round", str(record["game"] + 1)), ("White", record["white"]), ("Black", record["black"]),
+               ("Result", record["result"]), ("Termination", record["termination"]), ("PlyCount", str(record["plies"]))]
+    lines = ['[%s "%s"]' % header for header in headers]
+    tokens = []
+    for ply, notation in enumerate(record["moves"]):
+        if ply % 2 == 0:
+            tokens.append("%d." % (ply // 2 + 1))
+        tokens.append(notation)
+    tokens.append(record["result"])
+    moveText = []
+    line = ""
+    for token in tokens:  # PGN lines are kept under 80 characters
+        if len(line) + len(token) + 1 > 79:
+            moveText.append(line)
+            line = token
+        else:
+            line = token if not line else line + " " + token
+    moveText.append(line)
+    return "\n".join(lines) + "\n\n" + "\n".join(moveText) + "\n\n"
+
+
+"""
+Method to get the wins, draws and losses of player from a list of game records
+"""
+
+
+def tally(records, player):
+    wins = draws = losses = 0
+    for record in records:
+        if record["result"] == DRAW:
+            draws += 1
+        elif (record["result"] == WHITE_WINS) == (record["white"] == player):
+            wins += 1
+        else:
+            losses += 1
+    return wins, draws, losses
+
+
+"""
+Method to estimate the Elo difference from a W/D/L score, returns (difference, 95% margin),
+None values when every game was won or lost
+"""
+
+
+def eloEstimate(wins, draws, losses):
+    games = wins + draws + losses
+    if games == 0:
+        return None, None
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return None, None
+    difference = -400 * math.log10(1 / score - 1)
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+    low, high = max(score - margin, 1e-6), min(score + margin, 1 - 1e-6)
+    return difference, (-400 * math.log10(1 / high - 1) + 400 * math.log10(1 / low - 1)) / 2
+
+
+def formatTally(records, player, opponent):
+    wins, draws, losses = tally(records, player)
+    difference, margin = eloEstimate(wins, draws, losses)
+    elo = "Elo %+.0f +/- %.0f" % (difference, margin) if difference is not None else "Elo n/a"
+    return "%s vs %s: +%d =%d -%d  %s" % (player, opponent, wins, draws, losses, elo)
+
+
+"""
+Method to read the records of games already finished in the output directory, for resuming
+"""
+
+
+def loadRecords(outDir):
+    records = {}
+    path = os.path.join(outDir, RESULTS_FILE)
+    if os.path.exists(path):
+        with open(path) as results:
+            for line in results:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:  # a line cut off by the interruption, that game is played again
+                    continue
+                records[record["game"]] = record
+    return records
+
+
+"""
+Method to run a match: games alternate colors, each game goes to the process pool
+and is appended to the results and PGN files as soon as it finishes
+returns the records of every game of the match
+"""
+
+
+def runMatch(playerOne, playerTwo, games, outDir, moveTime=None, openingPlies=OPENING_PLIES, workers=None,
+             seed=0, maxPlies=MAX_PLIES, out=None):
+    os.makedirs(outDir, exist_ok=True)
+    records = loadRecords(outDir)
+    todo = [index for index in range(games) if index not in records]
+    if out is not None and records:
+        out.write("resuming: %d of %d games already played\n" % (games - len(todo), games))
+    resultsPath = os.path.join(outDir, RESULTS_FILE)
+    pgnPath = os.path.join(outDir, PGN_FILE)
+    event = "%s vs %s" % (playerOne, playerTwo)
+    # both files are rewritten from the finished games, even when there are none, dropping whatever an
+    # interruption cut off or a PGN left behind without results
+    with open(resultsPath, "w") as results, open(pgnPath, "w") as pgn, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for index in sorted(records):
+            results.write(json.dumps(records[index]) + "\n")
+            pgn.write(gameToPgn(records[index], event))
+        results.flush()
+        pgn.flush()
+        futures = []
+        for index in todo:
+            white, black = (playerOne, playerTwo) if index % 2 == 0 else (playerTwo, playerOne)
+            futures.append(executor.submit(playGame, index, white, black, moveTime, openingPlies, seed, maxPlies))
+        for future in concurrent.futures.as_completed(futures):
+            record = future.result()
+            records[record["game"]] = record
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+            pgn.write(gameToPgn(record, event))
+            pgn.flush()
+            if out is not None:
+                out.write("game %d: %s %s %s (%s, %d plies)  |  %s\n" % (
+                    record["game"] + 1, record["white"], record["result"], record["black"], record["termination"],
+                    record["plies"], formatTally(records.values(), playerOne, playerTwo)))
+                out.flush()
+    return [records[index] for index in sorted(records)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="play a headless match between two AIs")
+    parser.add_argument("playerOne", choices=PLAYERS)
+    parser.add_argument("playerTwo", choices=PLAYERS)
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--out", default="matches", help="directory of the PGN and results files (resumed if present)")
+    parser.add_argument("--movetime", type=float, help="seconds per move for the medium AI and stockfish")
+    parser.add_argument("--opening-plies", type=int, default=OPENING_PLIES, help="random plies before the AIs play")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="longer games are drawn")
+    parser.add_argument("--workers", type=int, help="processes playing games (default: every core)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random openings")
+    args = parser.parse_args(argv)
+    records = runMatch(args.playerOne, args.playerTwo, args.games, args.out, args.movetime, args.opening_plies,
+                       args.workers, args.seed, args.max_plies, sys.stdout)
+    print(formatTally(records, args.playerOne, args.playerTwo))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
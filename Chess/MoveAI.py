@@ -4,6 +4,7 @@ This script contains the AI algorithms used in this engine
 
 import random
 import time
+from Chess import Book, Tablebase, Transposition, MoveOrdering
 
 """
 CONSTANTS
@@ -80,10 +81,243 @@ piecePositionScores = {"Q": queenScore,
                        "R": rookScore,
                        "bp": blackPawnScore,
                        "wp": whitePawnScore}
+# material plus positional score of every piece on every square, positive for white and negative for black
+pieceSquareValues = {}
+for _piece in ("wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"):
+    _sign = 1 if _piece[0] == 'w' else -1
+    if _piece[1] == "K":
+        _table = [[0] * 8 for _ in range(8)]
+    else:
+        _table = piecePositionScores[_piece] if _piece[1] == "p" else piecePositionScores[_piece[1]]
+    pieceSquareValues[_piece] = [[_sign * (pieceScore[_piece[1]] + _table[r][c]) for c in range(8)] for r in range(8)]
+
 CHECKMATE = 9999
 STALEMATE = 0
 DEPTH = 2
-MAX_TIME = 15.0
+MAX_DEPTH = 32
+MAX_TIME = 15.0  # hard limit, the search is aborted when it runs out
+SOFT_TIME_RATIO = 0.4  # no new iteration is started after this fraction of the time budget
+HASH_SIZE_MB = 16
+EVAL_CACHE_SIZE = 1 << 16  # positions whose static score is remembered, 0 turns the cache off
+EVAL_CONSISTENCY_CHECK = False  # assert the incremental score equals a full recompute on every evaluation
+
+# search techniques, each can be switched off with setSearchOptions e.g: to measure what it saves
+USE_PVS = True  # principal variation search: moves after the first are tried with a zero window
+USE_ASPIRATION = True  # iterations start with a narrow window around the previous score
+USE_NULL_MOVE = True  # null-move pruning: if passing still beats beta, the node is cut
+USE_LMR = True  # late move reductions: late quiet moves are searched less deep first
+ASPIRATION_WINDOW = 3  # half width of the first window, doubled on every fail
+ASPIRATION_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3  # the first moves of a node are never reduced
+LMR_LATE_MOVES = 8  # moves from here on are reduced by 2 plies instead of 1
+USE_DELTA_PRUNING = True  # quiescence: skip captures that can't lift the score back up to alpha
+USE_SEE_PRUNING = True  # quiescence: skip captures that lose material
+DELTA_MARGIN = 4  # positional gain a capture may bring on top of the captured piece
+TABLEBASE_PIECES = 3  # positions with this many pieces or fewer (kings included) are looked up, not searched
+
+transpositionTable = Transposition.TranspositionTable(HASH_SIZE_MB)
+evalCache = Transposition.EvalCache(EVAL_CACHE_SIZE)  # shared by the main search and the quiescence search
+moveOrderer = MoveOrdering.MoveOrderer()
+openingBook = Book.OpeningBook(Book.DEFAULT_BOOK_PATH)  # mapped on the first lookup, no book file means no book moves
+tablebase = Tablebase.Tablebase(Tablebase.TABLEBASE_PATH)  # same, no tablebase file means every position is searched
+principalVariationMoves = {}  # zobrist key -> move code of the last completed iteration's principal variation
+nodesSearched = 0
+nodeLimit = None
+hardDeadline = None
+stopSignal = None  # optional callable, the running search is aborted as soon as it returns True
+ponderSignal = None  # callable polled while pondering, returns True once the predicted move was played
+softDeadline = None
+searchBudget = None  # (start time, hard, soft seconds) of the pondering search
+completedDepth = 0  # depth of the last iteration findBestMoveIterative completed
+searchStats = {}  # counters of the last findBestMoveIterative search, see getSearchStats
+
+
+class SearchTimeout(Exception):
+    pass
+
+"""
+Method to change the memory budget of the transposition table (drops its contents)
+"""
+
+
+def setHashSize(sizeMB):
+    transpositionTable.resize(sizeMB)
+
+
+"""
+Method to change the number of positions the evaluation cache holds (drops its contents)
+"""
+
+
+def setEvalCacheSize(size):
+    evalCache.resize(size)
+
+
+"""
+Method to get the hit rate and usage of the evaluation cache since its statistics were last reset
+"""
+
+
+def getEvalCacheStats():
+    return evalCache.getStats()
+
+
+"""
+Method to switch the search techniques on or off, options left to None keep their setting
+"""
+
+
+def setSearchOptions(pvs=None, aspiration=None, nullMove=None, lmr=None, deltaPruning=None, seePruning=None):
+    global USE_PVS, USE_ASPIRATION, USE_NULL_MOVE, USE_LMR, USE_DELTA_PRUNING, USE_SEE_PRUNING
+    if pvs is not None:
+        USE_PVS = pvs
+    if aspiration is not None:
+        USE_ASPIRATION = aspiration
+    if nullMove is not None:
+        USE_NULL_MOVE = nullMove
+    if lmr is not None:
+        USE_LMR = lmr
+    if deltaPruning is not None:
+        USE_DELTA_PRUNING = deltaPruning
+    if seePruning is not None:
+        USE_SEE_PRUNING = seePruning
+
+
+"""
+Method to get the node count of the last search and how often each technique fired:
+null-move cutoffs, late move reductions and their re-searches, PVS re-searches, aspiration fails,
+the quiescence moves pruned by delta and SEE pruning or found illegal once made, and the tablebase hits
+"""
+
+
+def getSearchStats():
+    stats = dict(searchStats)
+    stats["nodes"] = nodesSearched
+    stats["depth"] = completedDepth
+    return stats
+
+
+def resetSearchStats():
+    global searchStats
+    searchStats = {"nullMoveTries": 0, "nullMoveCutoffs": 0, "lmrReductions": 0, "lmrResearches": 0,
+                   "pvsResearches": 0, "aspirationFails": 0, "deltaPruned": 0, "seePruned": 0, "illegalSkipped": 0,
+                   "tablebaseHits": 0}
+
+
+resetSearchStats()
+
+"""
+Method to use another Polyglot opening book, None turns the book off
+"""
+
+
+def setOpeningBook(path):
+    global openingBook
+    if openingBook is not None:
+        openingBook.close()
+    openingBook = Book.OpeningBook(path) if path is not None else None
+
+
+"""
+Method to get a weighted random book move for the position, None when it is out of the book
+"""
+
+
+def findBookMove(gamestate, validMoves):
+    if openingBook is None:
+        return None
+    return openingBook.chooseMove(gamestate, validMoves)
+
+
+"""
+Method to use another endgame tablebase file (see Chess.Tablebase), None turns the tablebase off
+"""
+
+
+def setTablebase(path):
+    global tablebase
+    if tablebase is not None:
+        tablebase.close()
+    tablebase = Tablebase.Tablebase(path) if path is not None else None
+
+
+"""
+Helper method to get the score of a position from the tablebase for the side to move, None when it isn't in it
+- a win scores just under a checkmate, less the further the mate is, so the search heads for the quickest one
+"""
+
+
+def probeTablebase(gamestate):
+    if tablebase is None or gamestate.pieceCount > TABLEBASE_PIECES:
+        return None
+    result = tablebase.probe(gamestate)
+    if result is None:
+        return None
+    searchStats["tablebaseHits"] += 1
+    outcome, plies = result
+    if outcome == Tablebase.DRAW:
+        return STALEMATE
+    return (CHECKMATE - 1 - plies) if outcome == Tablebase.WIN else -(CHECKMATE - 1 - plies)
+
+
+"""
+Method to pick the move of a tablebase position: the quickest mate when winning, a move that keeps the draw,
+or the longest resistance when losing, None when the position isn't in the tablebase
+"""
+
+
+def findTablebaseMove(gamestate, validMoves):
+    if probeTablebase(gamestate) is None:
+        return None
+    bestMove = None
+    bestScore = -CHECKMATE - 1
+    for move in validMoves:
+        gamestate.makeMove(move)
+        if gamestate.getValidMoves():
+            score = probeTablebase(gamestate)
+            score = -score if score is not None else STALEMATE  # e.g: the lone king took the piece
+        else:
+            score = CHECKMATE if gamestate.checkMate else STALEMATE
+        gamestate.undoMove()
+        if score > bestScore:
+            bestScore = score
+            bestMove = move
+    return bestMove
+
+
+"""
+Method to swap the transposition table, e.g: for one shared between processes (Transposition.SharedTranspositionTable)
+"""
+
+
+def setTranspositionTable(table):
+    global transpositionTable
+    transpositionTable = table
+
+
+"""
+Method to plug in another move ordering stage, it needs the methods of MoveOrdering.MoveOrderer
+"""
+
+
+def setMoveOrderer(orderer):
+    global moveOrderer
+    moveOrderer = orderer
+
+
+"""
+Method to let another thread or process abort searches, e.g: when the player takes a move back
+- signal is a callable polled every few nodes, None removes it
+"""
+
+
+def setStopSignal(signal):
+    global stopSignal
+    stopSignal = signal
+
 
 """
 Method to generate random moves 
@@ -194,55 +428,241 @@ def findNegaMaxMove(gamestate, validMoves, depth, turnMultuplier):
 
 """
 Method to implement NegaMax with Alpha beta pruning
+- principal variation search: the first (best ordered) move gets the full window, the others a zero window
+  that only proves they are no better, a move that turns out better is searched again with the full window
+- null-move pruning: when passing the turn still scores above beta at a reduced depth, the node is cut
+  (not in check, nor without pieces other than pawns where zugzwang makes passing misleading, nor twice in a row)
+- late move reductions: quiet moves far down the ordering are searched shallower first, and at full depth
+  only if they beat alpha
 """
 
 
-def findNegaMaxAlphaBeta(gamestate, validMoves, depth, alpha, beta, turnMultuplier):
+def findNegaMaxAlphaBeta(gamestate, validMoves, depth, alpha, beta, turnMultuplier, ply=0, allowNullMove=True):
     global nextMove
-    if depth == 0:
+    if depth <= 0:
         return quiescenceSearch(gamestate, alpha, beta, turnMultuplier)
+    countNode()
+    if len(validMoves) == 0:
+        return -CHECKMATE if gamestate.checkMate else STALEMATE
+    # a position met before on the path or in the game is scored as a draw right away: repeating it can't gain anything
+    if ply != 0 and (gamestate.repetitionCount() > 1 or gamestate.halfmoveClock >= 100 or
+                     gamestate.insufficientMaterial):
+        return STALEMATE
+    if ply != 0 and gamestate.pieceCount <= TABLEBASE_PIECES:
+        score = probeTablebase(gamestate)
+        if score is not None:
+            return score
+    alphaOrig = alpha
+    key = gamestate.zobristKey
+    entry = transpositionTable.probe(key)
+    hashMove = Transposition.NO_MOVE
+    if entry is not None:
+        entryDepth, entryScore, entryBound, hashMove = entry
+        if entryDepth >= depth and ply != 0:  # never cut at the root, it has to set nextMove
+            if entryBound == Transposition.EXACT:
+                return entryScore
+            elif entryBound == Transposition.LOWER_BOUND:
+                alpha = max(alpha, entryScore)
+            else:
+                beta = min(beta, entryScore)
+            if alpha >= beta:
+                return entryScore
+    inCheck = (USE_NULL_MOVE or USE_LMR) and depth >= min(NULL_MOVE_MIN_DEPTH, LMR_MIN_DEPTH) and gamestate.inCheck()
+    if USE_NULL_MOVE and allowNullMove and ply != 0 and depth >= NULL_MOVE_MIN_DEPTH and not inCheck and \
+            beta < CHECKMATE and gamestate.hasNonPawnMaterial():
+        searchStats["nullMoveTries"] += 1
+        gamestate.makeNullMove()
+        score = -findNegaMaxAlphaBeta(gamestate, gamestate.getValidMoves(), depth - 1 - NULL_MOVE_REDUCTION,
+                                      -beta, -beta + 1, -turnMultuplier, ply + 1, False)
+        gamestate.undoMove()
+        if score >= beta:
+            searchStats["nullMoveCutoffs"] += 1
+            return beta
+    validMoves = moveOrderer.orderMoves(validMoves, ply, hashMove,
+                                        principalVariationMoves.get(key, Transposition.NO_MOVE), gamestate)
     maxScore = -CHECKMATE
-    for move in validMoves:
+    bestMove = None
+    for i, move in enumerate(validMoves):
         gamestate.makeMove(move)
         nextMoves = gamestate.getValidMoves()
-        score = -findNegaMaxAlphaBeta(gamestate, nextMoves, depth - 1, -beta, -alpha, -turnMultuplier)
+        if i == 0:
+            score = -findNegaMaxAlphaBeta(gamestate, nextMoves, depth - 1, -beta, -alpha, -turnMultuplier, ply + 1)
+        else:
+            reduction = 0
+            if USE_LMR and i >= LMR_MIN_MOVES and depth >= LMR_MIN_DEPTH and not inCheck and not move.isCapture and \
+                    not move.isPawnPromotion and not gamestate.inCheck():
+                reduction = 1 if i < LMR_LATE_MOVES else 2
+                searchStats["lmrReductions"] += 1
+            searchBeta = alpha + 1 if USE_PVS else beta
+            score = -findNegaMaxAlphaBeta(gamestate, nextMoves, depth - 1 - reduction, -searchBeta, -alpha,
+                                          -turnMultuplier, ply + 1)
+            if reduction and score > alpha:
+                searchStats["lmrResearches"] += 1
+                score = -findNegaMaxAlphaBeta(gamestate, nextMoves, depth - 1, -searchBeta, -alpha,
+                                              -turnMultuplier, ply + 1)
+            if USE_PVS and alpha < score < beta:
+                searchStats["pvsResearches"] += 1
+                score = -findNegaMaxAlphaBeta(gamestate, nextMoves, depth - 1, -beta, -alpha, -turnMultuplier,
+                                              ply + 1)
         if score > maxScore:
             maxScore = score
-            if depth == DEPTH:
+            bestMove = move
+            if ply == 0:
                 nextMove = move
         gamestate.undoMove()
         if maxScore > alpha:
             alpha = maxScore
         if alpha >= beta:
+            moveOrderer.recordCutoff(move, ply, depth, i)
             break
+    if maxScore <= alphaOrig:
+        bound = Transposition.UPPER_BOUND
+    elif maxScore >= beta:
+        bound = Transposition.LOWER_BOUND
+    else:
+        bound = Transposition.EXACT
+    transpositionTable.store(key, depth, maxScore, bound, Transposition.moveCode(bestMove))
     return maxScore
 
 
+"""
+Helper method to count a searched node and abort the search when the node or time budget runs out
+or the stop signal is raised
+"""
+
+
+def countNode():
+    global nodesSearched
+    nodesSearched += 1
+    if nodeLimit is not None and nodesSearched >= nodeLimit:
+        raise SearchTimeout()
+    if nodesSearched & 63 == 0:
+        if ponderSignal is not None:
+            checkPonderHit()
+        if hardDeadline is not None and time.time() >= hardDeadline:
+            raise SearchTimeout()
+        if stopSignal is not None and stopSignal():
+            raise SearchTimeout()
+
+
+"""
+Helper method to put a pondering search on the clock once its predicted move is played,
+the time spent pondering counts, so after a long ponder the move comes right away
+"""
+
+
+def checkPonderHit():
+    global ponderSignal, hardDeadline, softDeadline
+    if ponderSignal():
+        ponderSignal = None
+        startTime, maxTime, softTime = searchBudget
+        now = time.time()
+        softDeadline = startTime + softTime
+        hardDeadline = startTime + maxTime if now < softDeadline else now
+
+
 """
 Helper method to implement Quiescence search to help NegaMax
+- only captures and promotions are searched, generated pseudo-legal and tested for legality once made
+- captures that can't bring the score back to alpha (delta pruning) or that lose material (SEE) are skipped
+- in check there is no standing pat: every legal evasion is searched and no evasion scores as mate
 """
 
 
 def quiescenceSearch(gamestate, alpha, beta, turnMultuplier):
+    countNode()
+    if gamestate.pieceCount <= TABLEBASE_PIECES:
+        score = probeTablebase(gamestate)
+        if score is not None:
+            return score
+    if gamestate.inCheck():
+        return quiescenceEvasions(gamestate, alpha, beta, turnMultuplier)
     stand_pat = turnMultuplier * scoreBoard(gamestate)
     if stand_pat >= beta:
         return beta
     if alpha < stand_pat:
         alpha = stand_pat
 
-    validMoves = gamestate.getValidMoves()
-    for move in validMoves:
-        if move.isCapture:
-            gamestate.makeMove(move)
-            score = -quiescenceSearch(gamestate, -beta, -alpha, -turnMultuplier)
+    for move in getQuiescenceMoves(gamestate):
+        if not move.isPawnPromotion:
+            if USE_DELTA_PRUNING and stand_pat + captureGain(move) + DELTA_MARGIN <= alpha:
+                searchStats["deltaPruned"] += 1
+                continue
+            if USE_SEE_PRUNING and isLosingCapture(gamestate, move):
+                searchStats["seePruned"] += 1
+                continue
+        gamestate.makeMove(move)
+        if gamestate.kingLeftInCheck():
             gamestate.undoMove()
-            if score >= beta:
-                return beta
-            if score > alpha:
-                alpha = score
+            searchStats["illegalSkipped"] += 1
+            continue
+        score = -quiescenceSearch(gamestate, -beta, -alpha, -turnMultuplier)
+        gamestate.undoMove()
+        if score >= beta:
+            return beta
+        if score > alpha:
+            alpha = score
     return alpha
 
 
+"""
+Helper method for quiescence when the side to move is in check, the evasions are already legal
+e.g: a quiet king step out of a capture-check is searched too, so a mate behind the horizon isn't scored as material
+"""
+
+
+def quiescenceEvasions(gamestate, alpha, beta, turnMultuplier):
+    evasions = gamestate.getValidMoves()
+    if len(evasions) == 0:
+        return -CHECKMATE
+    captures = moveOrderer.orderCaptures([move for move in evasions if move.isCapture])
+    for move in captures + [move for move in evasions if not move.isCapture]:
+        gamestate.makeMove(move)
+        score = -quiescenceSearch(gamestate, -beta, -alpha, -turnMultuplier)
+        gamestate.undoMove()
+        if score >= beta:
+            return beta
+        if score > alpha:
+            alpha = score
+    return alpha
+
+
+"""
+Helper method to hand out the quiescence moves in stages: captures by MVV-LVA first, then quiet promotions,
+a cutoff in the first stage saves sorting the second
+"""
+
+
+def getQuiescenceMoves(gamestate):
+    moves = gamestate.getCaptureMoves()
+    yield from moveOrderer.orderCaptures([move for move in moves if move.isCapture])
+    for move in moves:
+        if not move.isCapture:
+            yield move
+
+
+"""
+Helper method to get the material and positional value of the piece a capture takes
+"""
+
+
+def captureGain(move):
+    row = move.startRow if move.isEnPassantMove else move.endRow
+    return abs(pieceSquareValues[move.pieceCaptured][row][move.endCol])
+
+
+"""
+Helper method to tell a capture that loses material once the exchange on its square is played out,
+taking a piece at least as valuable as the capturing one never loses
+"""
+
+
+def isLosingCapture(gamestate, move):
+    if pieceScore[move.pieceCaptured[1]] >= pieceScore[move.pieceMoved[1]]:
+        return False
+    return gamestate.see(move) < 0
+
+
 """
 Method to make first recursive call to algorithm (difficulty: 1)
 """
@@ -250,7 +670,9 @@ Method to make first recursive call to algorithm (difficulty: 1)
 
 def findBestMove(gamestate, validMoves):
     global nextMove
-    nextMove = None
+    nextMove = findBookMove(gamestate, validMoves)
+    if nextMove is not None:
+        return nextMove
     random.shuffle(validMoves)
     findMinMaxMove(gamestate, validMoves, DEPTH, 1 if gamestate.whiteToMove else - 1)
     return nextMove
@@ -261,12 +683,130 @@ Method to make first recursive call to algorithm (difficulty: 2)
 """
 
 
-def findBestMove2(gamestate, validMoves):
-    global nextMove
-    nextMove = None
+def findBestMove2(gamestate, validMoves, ponderHit=None):
+    bookMove = findBookMove(gamestate, validMoves)
+    if bookMove is not None:
+        return bookMove
     random.shuffle(validMoves)
-    findNegaMaxAlphaBeta(gamestate, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gamestate.whiteToMove else - 1)
-    return nextMove
+    return findBestMoveIterative(gamestate, validMoves, ponderHit=ponderHit)
+
+
+"""
+Method to run an iterative deepening search: depth 1, 2, 3... until the time or node budget runs out
+- no new iteration starts after the soft time limit, a running one is aborted at the hard limit
+- the best move of the last completed iteration is returned
+- with ponderHit the search runs on the opponent's time: there is no time limit until ponderHit() returns True,
+  then the limits apply as if the search had started on the clock
+- startDepth skips the first iterations, reportIteration(depth, move, score) is called after every completed one
+"""
+
+
+def findBestMoveIterative(gamestate, validMoves, maxTime=MAX_TIME, softTime=None, maxNodes=None, maxDepth=MAX_DEPTH,
+                          ponderHit=None, startDepth=1, reportIteration=None):
+    global nextMove, nodesSearched, nodeLimit, hardDeadline, softDeadline, ponderSignal, searchBudget
+    global principalVariationMoves, completedDepth
+    startTime = time.time()
+    nodesSearched = 0
+    completedDepth = 0
+    resetSearchStats()
+    tablebaseMove = findTablebaseMove(gamestate, validMoves)
+    if tablebaseMove is not None:  # nothing to search, the tablebase knows the result
+        return tablebaseMove
+    if softTime is None:
+        softTime = maxTime * SOFT_TIME_RATIO
+    searchBudget = (startTime, maxTime, softTime)
+    ponderSignal = ponderHit
+    if ponderHit is None:
+        hardDeadline = startTime + maxTime
+        softDeadline = startTime + softTime
+    else:
+        hardDeadline = softDeadline = None
+    nodeLimit = maxNodes
+    principalVariationMoves = {}
+    transpositionTable.newSearch()
+    moveOrderer.newSearch()
+    rootLogLength = len(gamestate.moveLog)
+    turnMultiplier = 1 if gamestate.whiteToMove else -1
+    bestMove = None
+    score = None
+    for depth in range(startDepth, maxDepth + 1):
+        nextMove = None
+        try:
+            score = findAspirationMove(gamestate, validMoves, depth, score, turnMultiplier)
+        except SearchTimeout:
+            while len(gamestate.moveLog) > rootLogLength:  # unwind the moves of the aborted iteration
+                gamestate.undoMove()
+            break
+        bestMove = nextMove
+        completedDepth = depth
+        if reportIteration is not None:
+            reportIteration(depth, bestMove, score)
+        principalVariation = getPrincipalVariation(gamestate, depth)
+        principalVariationMoves = {}
+        for key, move in principalVariation:
+            principalVariationMoves[key] = Transposition.moveCode(move)
+        if ponderSignal is not None:
+            checkPonderHit()
+        if abs(score) >= CHECKMATE or (softDeadline is not None and time.time() >= softDeadline):
+            break
+    hardDeadline = softDeadline = None
+    ponderSignal = None
+    nodeLimit = None
+    return bestMove
+
+
+"""
+Method to search the root with an aspiration window: a narrow window around the previous iteration's score
+cuts more, when the score falls outside it the window is widened on that side and the root searched again
+"""
+
+
+def findAspirationMove(gamestate, validMoves, depth, previousScore, turnMultiplier):
+    if not USE_ASPIRATION or previousScore is None or depth < ASPIRATION_MIN_DEPTH or \
+            abs(previousScore) >= CHECKMATE:
+        return findNegaMaxAlphaBeta(gamestate, validMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+    window = ASPIRATION_WINDOW
+    alpha, beta = previousScore - window, previousScore + window
+    while True:
+        score = findNegaMaxAlphaBeta(gamestate, validMoves, depth, alpha, beta, turnMultiplier)
+        failedLow = score <= alpha and alpha > -CHECKMATE
+        failedHigh = score >= beta and beta < CHECKMATE
+        if not failedLow and not failedHigh:
+            return score
+        searchStats["aspirationFails"] += 1
+        window *= 2
+        if failedLow:
+            alpha = max(score - window, -CHECKMATE)
+        else:
+            beta = min(score + window, CHECKMATE)
+
+
+"""
+Method to get the principal variation by following the best moves stored in the transposition table,
+returns a list of (zobrist key, move) pairs
+"""
+
+
+def getPrincipalVariation(gamestate, maxLength):
+    principalVariation = []
+    seen = set()
+    while len(principalVariation) < maxLength and gamestate.zobristKey not in seen:
+        seen.add(gamestate.zobristKey)
+        entry = transpositionTable.probe(gamestate.zobristKey)
+        if entry is None:
+            break
+        move = None
+        for validMove in gamestate.getValidMoves():
+            if Transposition.moveCode(validMove) == entry[3]:
+                move = validMove
+                break
+        if move is None:
+            break
+        principalVariation.append((gamestate.zobristKey, move))
+        gamestate.makeMove(move)
+    for _ in principalVariation:
+        gamestate.undoMove()
+    return principalVariation
 
 
 """
@@ -346,13 +886,23 @@ def enemyAttacks(gamestate, kingRow, kingCol, isWhite):
 
 """
 Helper method to help the scoring method  
-number of valid moves to evaluate mobility
+number of pseudo-legal attacks to evaluate mobility,
+every square a piece attacks that isn't occupied by its own side counts
 """
 
 
 def mobility(gamestate):
-    mobilityScore = len(gamestate.getValidMoves())
-    return mobilityScore if gamestate.whiteToMove else -mobilityScore
+    mobilityScore = 0
+    board = gamestate.board
+    for color, sign in (('w', 1), ('b', -1)):
+        attackMap = gamestate.getAttackMap(color)
+        for r in range(8):
+            boardRow = board[r]
+            attackRow = attackMap[r]
+            for c in range(8):
+                if boardRow[c][0] != color:
+                    mobilityScore += sign * attackRow[c]
+    return mobilityScore
 
 
 """
@@ -387,33 +937,82 @@ def scoreBoard(gamestate):
             return -CHECKMATE
         else:
             return CHECKMATE
-    elif gamestate.staleMate:
+    elif gamestate.staleMate or gamestate.insufficientMaterial:
         return STALEMATE
 
-    score = 0
-    for row in range(len(gamestate.board)):
-        for col in range(len(gamestate.board[row])):
-            square = gamestate.board[row][col]
-            if square != "-":
-                # positional scoring
-                piecePositionScore = 0
-                if square[1] != "K":
-                    if square[1] == "p":  # pawn score
-                        piecePositionScore = piecePositionScores[square][row][col]
-                    else:  # other pieces score
-                        piecePositionScore = piecePositionScores[square[1]][row][col]
-            if square[0] == 'w':
-                score += pieceScore[square[1]] + piecePositionScore
-            if square[0] == 'b':
-                score -= pieceScore[square[1]] + piecePositionScore
+    # the score only depends on the position, so a position evaluated before is a lookup
+    # (skipped while checking the incremental score, every evaluation has to be recomputed then)
+    key = gamestate.zobristKey
+    if not EVAL_CONSISTENCY_CHECK:
+        score = evalCache.probe(key)
+        if score is not None:
+            return score
+
+    if gamestate.evaluator is None:
+        gamestate.evaluator = IncrementalEvaluator(gamestate)
+    score = gamestate.evaluator.score
+    if EVAL_CONSISTENCY_CHECK:
+        fullScore = scorePieceSquares(gamestate.board)
+        assert score == fullScore, "incremental score %d != full score %d after %s" % (
+            score, fullScore, [move.getChessNotation() for move in gamestate.moveLog])
 
     score += kingSafety(gamestate)
     score += mobility(gamestate)
     score += controlofCenter(gamestate)
 
+    evalCache.store(key, score)
     return score
 
 
+"""
+Helper method to compute the material and positional score of the board from scratch
+"""
+
+
+def scorePieceSquares(board):
+    score = 0
+    for row in range(len(board)):
+        for col in range(len(board[row])):
+            square = board[row][col]
+            if square != "-":
+                score += pieceSquareValues[square][row][col]
+    return score
+
+
+"""
+Class keeping the material and positional score of a game state up to date,
+GameState.makeMove/undoMove call it with every move so the score only changes by the move's delta
+"""
+
+
+class IncrementalEvaluator():
+    def __init__(self, gamestate):
+        self.score = scorePieceSquares(gamestate.board)
+
+    def makeMove(self, move):
+        self.score += self.moveDelta(move)
+
+    def undoMove(self, move):
+        self.score -= self.moveDelta(move)
+
+    def moveDelta(self, move):
+        values = pieceSquareValues
+        pieceMoved = move.pieceMoved
+        endPiece = pieceMoved[0] + 'Q' if move.isPawnPromotion else pieceMoved
+        delta = values[endPiece][move.endRow][move.endCol] - values[pieceMoved][move.startRow][move.startCol]
+        if move.isEnPassantMove:
+            delta -= values[move.pieceCaptured][move.startRow][move.endCol]
+        elif move.isCapture:
+            delta -= values[move.pieceCaptured][move.endRow][move.endCol]
+        if move.isCastleMove:
+            rookValues = values[pieceMoved[0] + 'R'][move.endRow]
+            if move.endCol - move.startCol == 2:  # kingside castle
+                delta += rookValues[move.endCol - 1] - rookValues[move.endCol + 1]
+            else:  # queenside castle
+                delta += rookValues[move.endCol + 1] - rookValues[move.endCol - 2]
+        return delta
+
+
 """
 Helper Method to Find board score based on material 
 """
@@ -0,0 +1,129 @@
+"""
+This script contains the move ordering used by our search
+good moves searched first make alpha-beta cut off sooner, so moves are sorted by:
+principal variation move, hash move, captures by MVV-LVA, killer moves, the history heuristic,
+then captures that lose material
+"""
+
+from Chess import Transposition
+
+"""
+CONSTANTS
+"""
+
+PV_MOVE_SCORE = 3000000
+HASH_MOVE_SCORE = 2000000
+CAPTURE_SCORE = 1000000  # + MVV-LVA, so every capture comes before quiet moves
+PROMOTION_SCORE = 900000
+KILLER_SCORES = (800000, 700000)  # first and second killer slot
+HISTORY_LIMIT = 600000  # history scores are kept below the killers
+LOSING_CAPTURE_SCORE = -1000  # + MVV-LVA, captures the static exchange evaluation finds losing go last
+
+# piece values for MVV-LVA: most valuable victim first, then least valuable attacker
+mvvLvaValues = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 10}
+
+"""
+Helper method to get the MVV-LVA score of a capture
+"""
+
+
+def mvvLva(move):
+    return mvvLvaValues[move.pieceCaptured[1]] * 16 - mvvLvaValues[move.pieceMoved[1]]
+
+
+class MoveOrderer():
+    def __init__(self, maxPly=64):
+        self.killers = [[Transposition.NO_MOVE, Transposition.NO_MOVE] for _ in range(maxPly)]
+        # butterfly tables by side, indexed by move code (from square * 64 + to square)
+        self.history = {'w': [0] * 4096, 'b': [0] * 4096}
+        self.resetStats()
+
+    def resetStats(self):
+        self.cutoffs = []  # beta cutoffs per ply
+        self.firstMoveCutoffs = []  # beta cutoffs per ply produced by the first move searched
+
+    """
+    Method to call at the start of every search, killers are dropped and the history fades out
+    """
+
+    def newSearch(self):
+        for killers in self.killers:
+            killers[0] = killers[1] = Transposition.NO_MOVE
+        for table in self.history.values():
+            for i in range(len(table)):
+                table[i] >>= 1
+        self.resetStats()
+
+    """
+    Method to get the ordering score of a move, higher is searched first
+    - with the gamestate, captures of a less valuable piece are checked with GameState.see
+    """
+
+    def scoreMove(self, move, ply, hashMove, pvMove, gamestate=None):
+        code = Transposition.moveCode(move)
+        if code == pvMove:
+            return PV_MOVE_SCORE
+        if code == hashMove:
+            return HASH_MOVE_SCORE
+        if move.isCapture:
+            if gamestate is not None and mvvLvaValues[move.pieceCaptured[1]] < mvvLvaValues[move.pieceMoved[1]] and \
+                    gamestate.see(move) < 0:
+                return LOSING_CAPTURE_SCORE + mvvLva(move)
+            return CAPTURE_SCORE + mvvLva(move)
+        if move.isPawnPromotion:
+            return PROMOTION_SCORE
+        if ply < len(self.killers):
+            killers = self.killers[ply]
+            if code == killers[0]:
+                return KILLER_SCORES[0]
+            if code == killers[1]:
+                return KILLER_SCORES[1]
+        return self.history[move.pieceMoved[0]][code]
+
+    """
+    Method to sort the moves of a node in the order they should be searched
+    """
+
+    def orderMoves(self, moves, ply=0, hashMove=Transposition.NO_MOVE, pvMove=Transposition.NO_MOVE, gamestate=None):
+        return sorted(moves, key=lambda move: self.scoreMove(move, ply, hashMove, pvMove, gamestate), reverse=True)
+
+    """
+    Method to sort captures by MVV-LVA alone, for quiescence search
+    """
+
+    def orderCaptures(self, moves):
+        return sorted(moves, key=mvvLva, reverse=True)
+
+    """
+    Method to learn from a beta cutoff: quiet moves become killers of the ply and gain history
+    """
+
+    def recordCutoff(self, move, ply, depth, moveIndex):
+        while len(self.cutoffs) <= ply:
+            self.cutoffs.append(0)
+            self.firstMoveCutoffs.append(0)
+        self.cutoffs[ply] += 1
+        if moveIndex == 0:
+            self.firstMoveCutoffs[ply] += 1
+        if move.isCapture:
+            return
+        code = Transposition.moveCode(move)
+        if ply < len(self.killers):
+            killers = self.killers[ply]
+            if killers[0] != code:
+                killers[1] = killers[0]
+                killers[0] = code
+        table = self.history[move.pieceMoved[0]]
+        table[code] += depth * depth
+        if table[code] >= HISTORY_LIMIT:  # keep history below the killers by halving the whole table
+            for i in range(len(table)):
+                table[i] >>= 1
+
+    """
+    Method to get per ply (cutoffs, cutoffs by the first move, first move fraction)
+    """
+
+    def getCutoffStats(self):
+        return [(self.cutoffs[ply], self.firstMoveCutoffs[ply],
+                 self.firstMoveCutoffs[ply] / self.cutoffs[ply] if self.cutoffs[ply] else 0.0)
+                for ply in range(len(self.cutoffs))]
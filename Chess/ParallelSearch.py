@@ -0,0 +1,405 @@
+"""
+This script contains the multiprocess searches of our AI
+- root splitting (ParallelSearch): the moves of the root position are split across a pool of worker processes,
+  each searching one root move with MoveAI.findNegaMaxAlphaBeta below the root, and the best score found so far
+  is shared so moves handed out later are searched with a tighter window
+- Lazy SMP (LazySMPSearch): every worker searches the whole root position at staggered depths, sharing one
+  transposition table in shared memory, so the workers feed each other's move ordering and cutoffs
+results come back as return values, nothing is passed through module globals between processes
+
+usage (from the repository root), time-to-depth of Lazy SMP against 1 worker:
+    python -m Chess.ParallelSearch --depth 4 --workers 1 2 4
+"""
+
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import random
+import sys
+import time
+from Chess import Engine, MoveAI, MoveOrdering, Transposition
+
+"""
+CONSTANTS
+"""
+
+WORKERS = os.cpu_count() or 1
+POLL_INTERVAL = 0.02  # seconds between checks of the stop and ponder signals while waiting for workers
+NO_ITERATION = 0  # shared iteration id telling every worker to stop
+ROOT_SPLIT = "root"
+LAZY_SMP = "lazysmp"
+PARALLEL_MODE = ROOT_SPLIT  # search used by the AI on multi-core machines
+UNLIMITED = 1e9  # seconds, Lazy SMP workers run until the game stops them
+BENCHMARK_POSITIONS = [
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+]
+
+# shared values inside a worker process, set by initWorker
+sharedIteration = None  # id of the iteration being searched, workers abort when it changes
+sharedAlpha = None  # best root score of the iteration so far
+sharedDeadline = None  # time.time() at which workers abort, 0 while there is no limit (pondering)
+sharedProgress = None  # Lazy SMP: (completed depth, move code, score) of every worker
+workerIteration = NO_ITERATION  # iteration of the root move this worker is searching
+cachedKey = None  # (start FEN, move codes) of the root position the worker rebuilt last
+cachedGame = None
+
+"""
+Helper method run once in every worker process
+"""
+
+
+def initWorker(iteration, alpha, deadline):
+    global sharedIteration, sharedAlpha, sharedDeadline
+    sharedIteration = iteration
+    sharedAlpha = alpha
+    sharedDeadline = deadline
+    MoveAI.setStopSignal(shouldStop)
+
+
+def shouldStop():
+    deadline = sharedDeadline.value
+    return sharedIteration.value != workerIteration or (deadline and time.time() >= deadline)
+
+
+"""
+Helper method to get the root position in a worker, rebuilt only when the game moved on
+"""
+
+
+def rootPosition(startFen, moveCodes):
+    global cachedKey, cachedGame
+    key = (startFen, bytes(moveCodes))
+    if key != cachedKey:
+        cachedGame = Engine.gameStateFromHistory(startFen, moveCodes)
+        cachedKey = key
+        MoveAI.transpositionTable.newSearch()
+        MoveAI.moveOrderer.newSearch()
+    return cachedGame
+
+
+"""
+Method run in a worker process: searches one root move to depth, with the root window (shared alpha, mate)
+returns (move code, score, exact, expected reply code or None, nodes) or None when the search was stopped
+- exact tells whether the score beat the alpha the move was searched with, otherwise it is only an upper bound
+"""
+
+
+def searchRootMove(iteration, startFen, moveCodes, moveCode, depth):
+    global workerIteration
+    workerIteration = iteration
+    if sharedIteration.value != iteration:
+        return None
+    gamestate = rootPosition(startFen, moveCodes)
+    rootLogLength = len(gamestate.moveLog)
+    move = None
+    for validMove in gamestate.getValidMoves():
+        if validMove.code == moveCode:
+            move = validMove
+            break
+    if move is None:
+        return None
+    alpha = sharedAlpha.value
+    turnMultiplier = 1 if gamestate.whiteToMove else -1
+    MoveAI.nodesSearched = 0
+    gamestate.makeMove(move)
+    key = gamestate.zobristKey
+    try:
+        score = -MoveAI.findNegaMaxAlphaBeta(gamestate, gamestate.getValidMoves(), depth - 1,
+                                             -MoveAI.CHECKMATE, -alpha, -turnMultiplier, 1)
+    except MoveAI.SearchTimeout:
+        return None
+    finally:
+        while len(gamestate.moveLog) > rootLogLength:
+            gamestate.undoMove()
+    if sharedIteration.value != iteration:
+        return None
+    entry = MoveAI.transpositionTable.probe(key)
+    expectedReply = entry[3] if entry is not None and entry[3] != Transposition.NO_MOVE else None
+    with sharedAlpha.get_lock():
+        if score > sharedAlpha.value:
+            sharedAlpha.value = score
+    return moveCode, score, score > alpha, expectedReply, MoveAI.nodesSearched
+
+
+"""
+Helper method run once in every Lazy SMP worker process, the worker's search uses the shared table
+"""
+
+
+def initLazyWorker(iteration, deadline, progress, tableName, tableSizeMB):
+    global sharedIteration, sharedDeadline, sharedProgress
+    sharedIteration = iteration
+    sharedDeadline = deadline
+    sharedProgress = progress
+    MoveAI.setTranspositionTable(Transposition.SharedTranspositionTable(tableSizeMB, tableName))
+    MoveAI.setStopSignal(shouldStop)
+
+
+"""
+Method run in a Lazy SMP worker: iterative deepening on the whole root position, until maxDepth or until stopped
+returns (worker index, completed depth, best move code or None, nodes)
+- helpers start one ply deeper every other worker and shuffle the root moves, so they do not all repeat the same work
+"""
+
+
+def lazySearch(iteration, index, generation, startFen, moveCodes, maxDepth):
+    global workerIteration
+    workerIteration = iteration
+    gamestate = rootPosition(startFen, moveCodes)
+    MoveAI.transpositionTable.generation = generation
+    validMoves = gamestate.getValidMoves()
+    if index:
+        random.Random(iteration * 1000 + index).shuffle(validMoves)
+
+    def report(depth, move, score):
+        sharedProgress[3 * index:3 * index + 3] = [depth, move.code if move is not None else 0, score]
+
+    move = MoveAI.findBestMoveIterative(gamestate, validMoves, UNLIMITED, UNLIMITED, maxDepth=maxDepth,
+                                        startDepth=min(1 + index % 2, maxDepth), reportIteration=report)
+    return index, MoveAI.completedDepth, move.code if move is not None else None, MoveAI.nodesSearched
+
+
+"""
+Method to get the search the AI should use on this machine
+"""
+
+
+def createSearch(mode=None, workers=WORKERS):
+    if (mode or PARALLEL_MODE) == LAZY_SMP:
+        return LazySMPSearch(workers)
+    return ParallelSearch(workers)
+
+
+class ParallelSearch():
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.iteration = multiprocessing.Value('i', NO_ITERATION)
+        self.alpha = multiprocessing.Value('i', -MoveAI.CHECKMATE)
+        self.deadline = multiprocessing.Value('d', 0.0)
+        self.iterationId = NO_ITERATION
+        self.executor = None  # started on the first search
+        self.nodesSearched = 0
+
+    """
+    Method to run an iterative deepening search with the root moves spread over the worker processes,
+    returns (best move, expected reply code or None), like MoveAI.findBestMoveIterative it returns the result
+    of the last completed iteration
+    - stopSignal is polled while waiting, the search is dropped (returns None, None) once it returns True
+    - with ponderHit there is no time limit until ponderHit() returns True, then the limits count from the start
+    """
+
+    def findBestMove(self, gamestate, validMoves, maxTime=MoveAI.MAX_TIME, softTime=None, maxDepth=MoveAI.MAX_DEPTH,
+                     stopSignal=None, ponderHit=None):
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=initWorker, initargs=(self.iteration, self.alpha, self.deadline))
+        startTime = time.time()
+        if softTime is None:
+            softTime = maxTime * MoveAI.SOFT_TIME_RATIO
+        self.deadline.value = 0.0 if ponderHit is not None else startTime + maxTime
+        softDeadline = None if ponderHit is not None else startTime + softTime
+        startFen, moveCodes = gamestate.serialize()
+        rootMoves = MoveOrdering.MoveOrderer().orderMoves(validMoves)
+        bestMove, expectedReply = None, None
+        self.nodesSearched = 0
+        for depth in range(1, maxDepth + 1):
+            self.iterationId += 1
+            self.alpha.value = -MoveAI.CHECKMATE
+            self.iteration.value = self.iterationId
+            scores = {}
+            replies = {}
+            # the first (best ordered) move is searched alone to get a good alpha, then the rest in parallel
+            batches = [rootMoves[:1], rootMoves[1:]]
+            for batch in batches:
+                futures = [self.executor.submit(searchRootMove, self.iterationId, startFen, moveCodes, move.code, depth)
+                           for move in batch]
+                if not self.collect(futures, scores, replies, stopSignal, ponderHit, startTime, maxTime, softTime):
+                    self.iteration.value = NO_ITERATION
+                    if stopSignal is not None and stopSignal():
+                        return None, None
+                    if bestMove is None:  # time ran out during depth 1
+                        return (rootMoves[0] if rootMoves else None), None
+                    return bestMove, expectedReply
+                if ponderHit is not None and self.deadline.value:
+                    softDeadline = startTime + softTime
+            # an upper bound can tie the best exact score, the move that really reached it goes first
+            rootMoves.sort(key=lambda move: scores[move.code], reverse=True)
+            bestMove = rootMoves[0]
+            expectedReply = replies.get(bestMove.code)
+            score = scores[bestMove.code][0]
+            if abs(score) >= MoveAI.CHECKMATE or (softDeadline is not None and time.time() >= softDeadline):
+                break
+        self.iteration.value = NO_ITERATION
+        return bestMove, expectedReply
+
+    """
+    Helper method to wait for the searches of a batch of root moves, returns False when the iteration
+    could not be completed (time ran out or the search was stopped)
+    """
+
+    def collect(self, futures, scores, replies, stopSignal, ponderHit, startTime, maxTime, softTime):
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=POLL_INTERVAL,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is None:
+                    return False
+                moveCode, score, exact, expectedReply, nodes = result
+                scores[moveCode] = (score, exact)
+                replies[moveCode] = expectedReply
+                self.nodesSearched += nodes
+            if stopSignal is not None and stopSignal():
+                return False
+            if ponderHit is not None and not self.deadline.value and ponderHit():
+                now = time.time()
+                self.deadline.value = startTime + maxTime if now < startTime + softTime else now
+        return True
+
+    def shutdown(self):
+        self.iteration.value = NO_ITERATION
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+class LazySMPSearch():
+    def __init__(self, workers=WORKERS, hashSizeMB=MoveAI.HASH_SIZE_MB):
+        self.workers = workers
+        self.table = Transposition.SharedTranspositionTable(hashSizeMB)
+        self.iteration = multiprocessing.Value('i', NO_ITERATION)
+        self.deadline = multiprocessing.Value('d', 0.0)
+        self.progress = multiprocessing.Array('i', 3 * workers)
+        self.iterationId = NO_ITERATION
+        self.executor = None  # started on the first search
+        self.nodesSearched = 0
+        self.completedDepth = 0
+
+    """
+    Method to search the position with every worker, returns (best move, expected reply code or None)
+    the result comes from the worker that completed the deepest iteration
+    - after the soft time limit only the iteration in progress is waited for (depth 1 when none is complete yet),
+      the workers are stopped at the hard limit, the first ordered move is played if even depth 1 wasn't done
+    - stopSignal and ponderHit work as in ParallelSearch.findBestMove
+    """
+
+    def findBestMove(self, gamestate, validMoves, maxTime=MoveAI.MAX_TIME, softTime=None, maxDepth=MoveAI.MAX_DEPTH,
+                     stopSignal=None, ponderHit=None):
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=initLazyWorker,
+                initargs=(self.iteration, self.deadline, self.progress, self.table.name, self.table.sizeMB))
+        startTime = time.time()
+        if softTime is None:
+            softTime = maxTime * MoveAI.SOFT_TIME_RATIO
+        self.deadline.value = 0.0 if ponderHit is not None else startTime + maxTime
+        softDeadline = None if ponderHit is not None else startTime + softTime
+        self.iterationId += 1
+        self.table.generation = (self.table.generation + 1) & 0xFF
+        self.progress[:] = [0] * len(self.progress)
+        self.iteration.value = self.iterationId
+        startFen, moveCodes = gamestate.serialize()
+        futures = [self.executor.submit(lazySearch, self.iterationId, index, self.table.generation, startFen,
+                                        moveCodes, maxDepth) for index in range(self.workers)]
+        softDepth = None  # deepest iteration completed when the soft limit passed
+        pending = set(futures)
+        while pending and self.iteration.value == self.iterationId:
+            done, pending = concurrent.futures.wait(pending, timeout=POLL_INTERVAL,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            if done:  # a worker reached maxDepth, the others have nothing left to add
+                break
+            if stopSignal is not None and stopSignal():
+                self.iteration.value = NO_ITERATION
+                concurrent.futures.wait(futures)
+                return None, None
+            if ponderHit is not None and not self.deadline.value and ponderHit():
+                now = time.time()
+                self.deadline.value = startTime + maxTime if now < startTime + softTime else now
+                softDeadline = startTime + softTime
+            depths = self.progress[0::3]
+            scores = self.progress[2::3]
+            if any(depth and abs(score) >= MoveAI.CHECKMATE for depth, score in zip(depths, scores)):
+                break
+            now = time.time()
+            if self.deadline.value and now >= self.deadline.value:  # the workers stop on their own, don't wait more
+                break
+            if softDeadline is not None and now >= softDeadline:
+                if softDepth is None:
+                    softDepth = max(depths)
+                elif max(depths) > softDepth:  # with no depth completed yet this waits for depth 1
+                    break
+        self.iteration.value = NO_ITERATION
+        results = [future.result() for future in futures]
+        self.nodesSearched = sum(result[3] for result in results)
+        index, depth, code, _ = max(results, key=lambda result: (result[1], -result[0]))
+        self.completedDepth = depth
+        bestMove = None
+        for move in validMoves:
+            if move.code == code:
+                bestMove = move
+                break
+        if bestMove is None and validMoves:  # stopped at the hard limit before depth 1 was done
+            bestMove = MoveOrdering.MoveOrderer().orderMoves(validMoves)[0]
+        expectedReply = None
+        if bestMove is not None:
+            gamestate.makeMove(bestMove)
+            entry = self.table.probe(gamestate.zobristKey)
+            gamestate.undoMove()
+            if entry is not None and entry[3] != Transposition.NO_MOVE:
+                expectedReply = entry[3]
+        return bestMove, expectedReply
+
+    def shutdown(self):
+        self.iteration.value = NO_ITERATION
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.table.release()
+
+
+"""
+Method to measure the time Lazy SMP takes to complete a depth on every position, for each worker count
+returns {workers: (seconds, nodes)}
+"""
+
+
+def benchmark(depth, workerCounts, positions=BENCHMARK_POSITIONS, out=None):
+    results = {}
+    for workers in workerCounts:
+        search = LazySMPSearch(workers)
+        totalTime = 0.0
+        totalNodes = 0
+        try:
+            for fen in positions:
+                gamestate = Engine.gameStateFromFen(fen)
+                start = time.time()
+                search.findBestMove(gamestate, gamestate.getValidMoves(), UNLIMITED, UNLIMITED, maxDepth=depth)
+                totalTime += time.time() - start
+                totalNodes += search.nodesSearched
+        finally:
+            search.shutdown()
+        results[workers] = (totalTime, totalNodes)
+        if out is not None:
+            base = results.get(workerCounts[0], (totalTime, 0))[0]
+            out.write("%3d workers  depth %d  %8.2fs  %10d nodes  speedup %.2fx\n"
+                      % (workers, depth, totalTime, totalNodes, base / max(totalTime, 1e-9)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lazy SMP time-to-depth benchmark")
+    parser.add_argument("--depth", type=int, default=4, help="depth every position is searched to (default 4)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, WORKERS],
+                        help="worker counts to compare, the first one is the baseline (default: 1 and every core)")
+    parser.add_argument("--fen", action="append", help="position to search instead of the built-in ones")
+    args = parser.parse_args(argv)
+    benchmark(args.depth, args.workers, args.fen or BENCHMARK_POSITIONS, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
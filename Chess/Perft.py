@@ -0,0 +1,143 @@
+"""
+This script contains the perft (performance test) tools of our engine
+perft counts the leaf nodes of the legal move tree to a fixed depth, divide splits that count by root move,
+comparing against known node counts catches move generation bugs, and nodes/sec gives a throughput baseline
+
+usage (from the repository root):
+    python -m Chess.Perft                       run the standard suite
+    python -m Chess.Perft --depth 4 --backend mailbox
+    python -m Chess.Perft --fen "<FEN>" --depth 3 --divide
+"""
+
+import argparse
+import sys
+import time
+
+from Chess import Engine
+
+"""
+CONSTANTS
+"""
+
+# name, FEN, expected node count per depth
+# our engine always promotes to a queen, so positions with promotions list the auto-queen counts,
+# cross-checked between the mailbox, bitboard and make/test/undo generators (published full-rule counts in comments)
+PERFT_SUITE = [
+    ("start position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862}),
+    ("rank pinned en passant", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("castling rooks only", "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1",
+     {1: 26, 2: 568, 3: 13744, 4: 314346}),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890}),
+    # published 6, 264, 9467
+    ("promotions and checks", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 228, 3: 8087}),
+    # published 44, 1486, 62379
+    ("promotion capture", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 41, 2: 1373, 3: 54007}),
+    # our own edge cases, counted with the three generators
+    ("en passant exposes king", "8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1",
+     {1: 6, 2: 136, 3: 863}),
+    ("en passant captures checker", "8/8/8/4k3/3Pp3/8/8/4K3 b - d3 0 1",
+     {1: 8, 2: 44, 3: 316}),
+    ("rook capture clears castling", "4k3/8/8/8/8/6n1/8/4K2R b K - 0 1",
+     {1: 11, 2: 131, 3: 1385}),
+]
+
+"""
+Method to count the leaf nodes of the legal move tree
+- generator is the name of the GameState method producing legal moves
+"""
+
+
+def perft(gamestate, depth, generator="getValidMoves"):
+    if depth == 0:
+        return 1
+    moves = getattr(gamestate, generator)()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gamestate.makeMove(move)
+        nodes += perft(gamestate, depth - 1, generator)
+        gamestate.undoMove()
+    return nodes
+
+
+"""
+Method to split the perft count by root move, returns {move notation: nodes}
+"""
+
+
+def divide(gamestate, depth, generator="getValidMoves"):
+    counts = {}
+    for move in getattr(gamestate, generator)():
+        gamestate.makeMove(move)
+        counts[move.getChessNotation()] = perft(gamestate, depth - 1, generator)
+        gamestate.undoMove()
+    return counts
+
+
+"""
+Method to run perft on every suite position up to maxDepth,
+returns a list of (name, depth, nodes, expected nodes, nodes per second)
+"""
+
+
+def runSuite(maxDepth=3, backend=Engine.DEFAULT_BACKEND, suite=PERFT_SUITE, generator="getValidMoves", out=None):
+    results = []
+    for name, fen, expected in suite:
+        for depth in sorted(expected):
+            if depth > maxDepth:
+                break
+            gamestate = Engine.gameStateFromFen(fen, backend)
+            start = time.time()
+            nodes = perft(gamestate, depth, generator)
+            elapsed = max(time.time() - start, 1e-9)
+            results.append((name, depth, nodes, expected[depth], nodes / elapsed))
+            if out is not None:
+                status = "ok" if nodes == expected[depth] else "FAIL (expected %d)" % expected[depth]
+                out.write("%-30s depth %d  %10d nodes  %10.0f nodes/s  %s\n" % (name, depth, nodes, nodes / elapsed, status))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="perft and divide over Engine.GameState")
+    parser.add_argument("--depth", type=int, default=3, help="maximum depth (default 3)")
+    parser.add_argument("--backend", choices=Engine.BACKENDS, default=Engine.DEFAULT_BACKEND)
+    parser.add_argument("--fen", help="run a single position instead of the suite")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--reference", action="store_true",
+                        help="use the slow make/test/undo generator (getValidMovesByFiltering)")
+    args = parser.parse_args(argv)
+    generator = "getValidMovesByFiltering" if args.reference else "getValidMoves"
+
+    if args.fen:
+        gamestate = Engine.gameStateFromFen(args.fen, args.backend)
+        start = time.time()
+        if args.divide:
+            counts = divide(gamestate, args.depth, generator)
+            for notation in sorted(counts):
+                print("%s: %d" % (notation, counts[notation]))
+            nodes = sum(counts.values())
+        else:
+            nodes = perft(gamestate, args.depth, generator)
+        elapsed = max(time.time() - start, 1e-9)
+        print("nodes %d  time %.2fs  %.0f nodes/s" % (nodes, elapsed, nodes / elapsed))
+        return 0
+
+    results = runSuite(args.depth, args.backend, generator=generator, out=sys.stdout)
+    failures = [result for result in results if result[2] != result[3]]
+    totalNodes = sum(result[2] for result in results)
+    totalTime = sum(result[2] / result[4] for result in results)
+    print("%d/%d passed, %.0f nodes/s overall" % (len(results) - len(failures), len(results),
+                                                   totalNodes / max(totalTime, 1e-9)))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+"""
+This script contains the endgame tablebase of our engine: king and queen, king and rook, king and pawn against king
+every position of these endgames is solved once by retrograde analysis (working backwards from the mates),
+stored as one byte per position in a small memory-mapped file, so the search looks the result up instead of searching
+the byte is 0 for a draw (or an impossible position), otherwise the number of plies to mate plus one,
+won for the side with the piece when it is to move, lost for the lone king when it is to move
+
+usage (from the repository root):
+    python -m Chess.Tablebase generate          solve the endgames and write assets/tablebase.bin
+    python -m Chess.Tablebase probe --fen "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from Chess import Engine, Transposition
+
+"""
+CONSTANTS
+"""
+
+TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "tablebase.bin")
+MAGIC = b"CTB1"
+HEADER = struct.Struct("<4sI")  # magic, number of tables
+TABLE_HEADER = struct.Struct("<4sII")  # name, offset, length
+TABLES = ("KQK", "KRK", "KPK")
+TABLE_OF_PIECE = {"Q": "KQK", "R": "KRK", "p": "KPK"}
+MAX_PIECES = 3  # kings included
+PROBE_CACHE_SIZE = 1 << 14  # probe results kept by zobrist key
+
+WIN, DRAW, LOSS = 1, 0, -1  # results for the side to move
+WHITE, BLACK = 0, 1  # side to move in an index, white always has the piece
+
+# positions are indexed ((side to move * 64 + white king) * 64 + black king) * 64 + piece, squares are row * 8 + col
+FULL_SIZE = 2 * 64 * 64 * 64
+# the file keeps one position of every mirror image: for KQK and KRK the white king on a1-d1-d4 (10 squares),
+# for KPK the pawn on files a-d (24 squares), the other positions are looked up mirrored
+TRIANGLE = [(7 - rank) * 8 + file for file in range(4) for rank in range(file + 1)]
+PAWN_SQUARES = [row * 8 + col for row in range(1, 7) for col in range(4)]
+
+"""
+Helper methods to build the square tables of the generator
+"""
+
+
+def squareOf(row, col):
+    return row * 8 + col if 0 <= row < 8 and 0 <= col < 8 else None
+
+
+def stepTable(offsets):
+    return [[square for square in (squareOf(s // 8 + dr, s % 8 + dc) for dr, dc in offsets) if square is not None]
+            for s in range(64)]
+
+
+def rayTable(directions):
+    rays = []
+    for s in range(64):
+        squareRays = []
+        for dr, dc in directions:
+            ray = []
+            row, col = s // 8 + dr, s % 8 + dc
+            while 0 <= row < 8 and 0 <= col < 8:
+                ray.append(row * 8 + col)
+                row, col = row + dr, col + dc
+            squareRays.append(ray)
+        rays.append(squareRays)
+    return rays
+
+
+KING_TARGETS = stepTable(Engine.KING_OFFSETS)
+KING_NEAR = [set(targets) for targets in KING_TARGETS]
+PIECE_RAYS = {"Q": rayTable(Engine.ORTHOGONAL_DIRECTIONS + Engine.DIAGONAL_DIRECTIONS),
+              "R": rayTable(Engine.ORTHOGONAL_DIRECTIONS)}
+WHITE_PAWN_ATTACKS = [set(targets) for targets in stepTable(((-1, -1), (-1, 1)))]
+# BETWEEN[kind][a][b]: squares strictly between a and b when the piece on a reaches b along a ray, else None
+BETWEEN = {}
+for _kind, _rays in PIECE_RAYS.items():
+    BETWEEN[_kind] = [[None] * 64 for _ in range(64)]
+    for _a in range(64):
+        for _ray in _rays[_a]:
+            for _i, _b in enumerate(_ray):
+                BETWEEN[_kind][_a][_b] = _ray[:_i]
+
+"""
+Helper method to tell whether the white piece on x attacks the target square, the white king (wk) can block it
+"""
+
+
+def pieceAttacks(kind, x, target, wk):
+    if kind == "p":
+        return target in WHITE_PAWN_ATTACKS[x]
+    between = BETWEEN[kind][x][target]
+    return between is not None and wk not in between
+
+
+"""
+Helper method to tell whether a position can happen: distinct squares, kings apart,
+no pawn on the first or last rank, and the side not to move not in check
+"""
+
+
+def isLegal(kind, stm, wk, bk, x):
+    if wk == bk or wk == x or bk == x or bk in KING_NEAR[wk]:
+        return False
+    if kind == "p" and (x < 8 or x >= 56):
+        return False
+    return stm == BLACK or not pieceAttacks(kind, x, bk, wk)
+
+
+def index(stm, wk, bk, x):
+    return ((stm * 64 + wk) * 64 + bk) * 64 + x
+
+
+"""
+Helper method to get the moves of the lone king: the squares it can go to, and whether it can take the piece
+"""
+
+
+def blackMoves(kind, wk, bk, x):
+    targets = []
+    canCapture = False
+    for target in KING_TARGETS[bk]:
+        if target == wk or target in KING_NEAR[wk]:
+            continue
+        if target == x:
+            canCapture = True  # the piece isn't defended by the king, or the king would be near
+        elif not pieceAttacks(kind, x, target, wk):
+            targets.append(target)
+    return targets, canCapture
+
+
+"""
+Method to solve one endgame by retrograde analysis, returns the full bytearray of FULL_SIZE results
+- mates are found first, then every position that can reach a lost position is won one ply further,
+  and a position of the lone king is lost once all of its moves lead to won positions
+- KPK needs the KQK results, a pawn that promotes reaches a KQK position
+"""
+
+
+def solve(kind, queenResults=None):
+    values = bytearray(FULL_SIZE)
+    movesLeft = bytearray(FULL_SIZE // 2)  # moves of the lone king not yet known to lose, by black position
+    buckets = [[]]  # positions by plies to mate, every position goes in once, when its result is set
+    promotions = {}  # KPK: white to move positions by plies to mate when promoting, used if nothing is shorter
+
+    def addToBucket(plies, position):
+        while len(buckets) <= plies:
+            buckets.append([])
+        buckets[plies].append(position)
+
+    blackOffset = index(BLACK, 0, 0, 0)
+    for wk in range(64):
+        for bk in range(64):
+            for x in range(64):
+                if not isLegal(kind, BLACK, wk, bk, x):
+                    continue
+                targets, canCapture = blackMoves(kind, wk, bk, x)
+                count = len(targets) + canCapture
+                position = index(BLACK, wk, bk, x)
+                movesLeft[position - blackOffset] = 255 if canCapture else count  # taking the piece draws
+                if count == 0 and pieceAttacks(kind, x, bk, wk):
+                    values[position] = 1  # checkmate
+                    addToBucket(0, position)
+    if kind == "p":  # promotions: seeded with the result of the KQK position they reach
+        for wk in range(64):
+            for bk in range(64):
+                for x in range(8, 16):
+                    promotion = x - 8
+                    if promotion in (wk, bk) or not isLegal(kind, WHITE, wk, bk, x):
+                        continue
+                    result = queenResults[index(BLACK, wk, bk, promotion)]
+                    if result:
+                        promotions.setdefault(result, []).append(index(WHITE, wk, bk, x))
+
+    plies = 0
+    while plies < len(buckets) or plies <= max(promotions, default=-1):
+        for position in promotions.get(plies, ()):
+            if values[position] == 0:  # nothing shorter than promoting was found
+                values[position] = plies + 1
+                addToBucket(plies, position)
+        for position in buckets[plies] if plies < len(buckets) else ():
+            stm, rest = divmod(position, 64 * 64 * 64)
+            wk, rest = divmod(rest, 64 * 64)
+            bk, x = divmod(rest, 64)
+            if stm == BLACK:  # lost for black: every white move that leads here wins
+                for previous in whiteUnmoves(kind, wk, bk, x):
+                    if values[previous] == 0:
+                        values[previous] = plies + 2
+                        addToBucket(plies + 1, previous)
+            else:  # won for white: one more of black's moves from every position leading here loses
+                for square in KING_TARGETS[bk]:
+                    if square == wk or square == x or square in KING_NEAR[wk]:
+                        continue
+                    previous = index(BLACK, wk, square, x)
+                    if values[previous] or movesLeft[previous - blackOffset] in (0, 255):
+                        continue
+                    movesLeft[previous - blackOffset] -= 1
+                    if movesLeft[previous - blackOffset] == 0:
+                        values[previous] = plies + 2
+                        addToBucket(plies + 1, previous)
+        plies += 1
+    return values
+
+
+"""
+Helper method to list the white to move positions one white move away from a black to move position
+"""
+
+
+def whiteUnmoves(kind, wk, bk, x):
+    previous = []
+    for square in KING_TARGETS[wk]:
+        if square != x and square != bk and square not in KING_NEAR[bk] and not pieceAttacks(kind, x, bk, square):
+            previous.append(index(WHITE, square, bk, x))
+    if kind == "p":
+        behind = x + 8  # one square back, the pawn pushed from there, or passed it on a double push
+        if behind < 56 and behind != wk and behind != bk:
+            if isLegal(kind, WHITE, wk, bk, behind):
+                previous.append(index(WHITE, wk, bk, behind))
+            start = x + 16
+            if x // 8 == 4 and start != wk and start != bk and isLegal(kind, WHITE, wk, bk, start):
+                previous.append(index(WHITE, wk, bk, start))
+    else:
+        for ray in PIECE_RAYS[kind][x]:
+            for square in ray:
+                if square == wk or square == bk:
+                    break
+                if isLegal(kind, WHITE, wk, bk, square):
+                    previous.append(index(WHITE, wk, bk, square))
+    return previous
+
+
+"""
+Helper methods to map a position to the one of its mirror images the file keeps
+"""
+
+
+def mirrorFile(square):
+    return square ^ 7
+
+
+def mirrorRank(square):
+    return square ^ 56
+
+
+def flipDiagonal(square):  # mirror along a1-h8
+    return (7 - square % 8) * 8 + 7 - square // 8
+
+
+def canonicalIndex(table, stm, wk, bk, x):
+    if table == "KPK":
+        if x % 8 > 3:
+            wk, bk, x = mirrorFile(wk), mirrorFile(bk), mirrorFile(x)
+        return (stm * len(PAWN_SQUARES) + PAWN_SLOTS[x]) * 64 * 64 + wk * 64 + bk
+    if wk % 8 > 3:
+        wk, bk, x = mirrorFile(wk), mirrorFile(bk), mirrorFile(x)
+    if wk // 8 < 4:
+        wk, bk, x = mirrorRank(wk), mirrorRank(bk), mirrorRank(x)
+    if 7 - wk // 8 > wk % 8:  # above the a1-h8 diagonal
+        wk, bk, x = flipDiagonal(wk), flipDiagonal(bk), flipDiagonal(x)
+    return ((stm * len(TRIANGLE) + TRIANGLE_SLOTS[wk]) * 64 + bk) * 64 + x
+
+
+TRIANGLE_SLOTS = {square: slot for slot, square in enumerate(TRIANGLE)}
+PAWN_SLOTS = {square: slot for slot, square in enumerate(PAWN_SQUARES)}
+
+"""
+Method to keep only the canonical positions of a solved table
+"""
+
+
+def compact(table, values):
+    if table == "KPK":
+        data = bytearray(2 * len(PAWN_SQUARES) * 64 * 64)
+        for stm in (WHITE, BLACK):
+            for x in PAWN_SQUARES:
+                for wk in range(64):
+                    for bk in range(64):
+                        data[canonicalIndex(table, stm, wk, bk, x)] = values[index(stm, wk, bk, x)]
+    else:
+        data = bytearray(2 * len(TRIANGLE) * 64 * 64)
+        for stm in (WHITE, BLACK):
+            for wk in TRIANGLE:
+                for bk in range(64):
+                    for x in range(64):
+                        data[canonicalIndex(table, stm, wk, bk, x)] = values[index(stm, wk, bk, x)]
+    return data
+
+
+"""
+Method to solve every endgame and write the tablebase file
+"""
+
+
+def generate(path=TABLEBASE_PATH, out=None):
+    tables = {}
+    solved = {}
+    for table, kind in (("KQK", "Q"), ("KRK", "R"), ("KPK", "p")):
+        startTime = time.time()
+        solved[table] = solve(kind, solved.get("KQK"))
+        tables[table] = compact(table, solved[table])
+        if out is not None:
+            longest = max(solved[table]) - 1
+            out.write("%s solved in %.1fs, longest mate %d plies\n" % (table, time.time() - startTime, longest))
+    offset = HEADER.size + TABLE_HEADER.size * len(tables)
+    with open(path, "wb") as tablebase:
+        tablebase.write(HEADER.pack(MAGIC, len(tables)))
+        for table in TABLES:
+            tablebase.write(TABLE_HEADER.pack(table.encode(), offset, len(tables[table])))
+            offset += len(tables[table])
+        for table in TABLES:
+            tablebase.write(tables[table])
+    return path
+
+
+class Tablebase():
+    def __init__(self, path=TABLEBASE_PATH, cacheSize=PROBE_CACHE_SIZE):
+        self.path = path
+        self.file = None
+        self.data = None  # the memory map, opened on the first probe
+        self.tables = {}  # name -> offset in the file
+        self.cache = Transposition.EvalCache(cacheSize)  # least recently used probe results by zobrist key
+
+    """
+    Helper method to map the file on first use, without a file every probe misses
+    """
+
+    def open(self):
+        if self.file is not None:
+            return
+        if not self.path or not os.path.exists(self.path):
+            self.file = False
+            return
+        self.file = open(self.path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError("%s isn't a tablebase file" % self.path)
+        for i in range(count):
+            name, offset, _ = TABLE_HEADER.unpack_from(self.data, HEADER.size + i * TABLE_HEADER.size)
+            self.tables[name.rstrip(b"\0").decode()] = offset
+
+    """
+    Method to look a position up, returns (result, plies to mate) for the side to move, result being WIN, DRAW
+    or LOSS, or None when the position isn't one of our endgames
+    """
+
+    def probe(self, gamestate):
+        if gamestate.pieceCount > MAX_PIECES:
+            return None
+        key = gamestate.zobristKey
+        result = self.cache.probe(key)
+        if result is None:
+            result = self.lookup(gamestate)
+            self.cache.store(key, result)
+        return result if result is not False else None
+
+    """
+    Helper method to read a position from the file, False when it isn't covered
+    """
+
+    def lookup(self, gamestate):
+        self.open()
+        if self.data is None:
+            return False
+        kings = {}
+        piece = None
+        for r in range(8):
+            for c in range(8):
+                square = gamestate.board[r][c]
+                if square == "-":
+                    continue
+                if square[1] == "K":
+                    kings[square[0]] = r * 8 + c
+                elif piece is not None:
+                    return False
+                else:
+                    piece = (square, r * 8 + c)
+        if piece is None or TABLE_OF_PIECE.get(piece[0][1]) not in self.tables:
+            return False
+        (color, kind), x = (piece[0][0], piece[0][1]), piece[1]
+        strongToMove = gamestate.whiteToMove == (color == "w")
+        wk, bk = kings[color], kings["b" if color == "w" else "w"]
+        if color == "b":  # seen from the other side, the tables have the piece on white's side
+            wk, bk, x = mirrorRank(wk), mirrorRank(bk), mirrorRank(x)
+        table = TABLE_OF_PIECE[kind]
+        value = self.data[self.tables[table] + canonicalIndex(table, WHITE if strongToMove else BLACK, wk, bk, x)]
+        if value == 0:
+            return DRAW, 0
+        return (WIN if strongToMove else LOSS), value - 1
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+        self.data = None
+        self.file = None
+        self.tables = {}
+        self.cache.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="generate or probe the KQK/KRK/KPK tablebase")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("generate", help="solve the endgames and write the tablebase file")
+    build.add_argument("--out", default=TABLEBASE_PATH)
+    probe = commands.add_parser("probe", help="look a position up")
+    probe.add_argument("--fen", required=True)
+    probe.add_argument("--tablebase", default=TABLEBASE_PATH)
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        print("written to " + generate(args.out, sys.stdout))
+        return 0
+    tablebase = Tablebase(args.tablebase)
+    result = tablebase.probe(Engine.gameStateFromFen(args.fen))
+    if result is None:
+        print("not in the tablebase")
+    else:
+        print({WIN: "win", DRAW: "draw", LOSS: "loss"}[result[0]] + (" in %d plies" % result[1] if result[0] else ""))
+    tablebase.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+This script contains the transposition table used by our search
+it remembers the depth, score, bound type and best move of searched positions
+by their Zobrist key, inside a fixed amount of memory
+it also holds the evaluation cache, static scores of positions by their Zobrist key
+"""
+
+from array import array
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+"""
+CONSTANTS
+"""
+
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high, the real score is at least this
+UPPER_BOUND = 2  # the search failed low, the real score is at most this
+
+NO_MOVE = 0  # a8a8 can never be a move
+ENTRY_BYTES = 16  # one 64-bit key and one 64-bit packed data word
+BUCKET_SLOTS = 2  # slot 0 prefers deep entries, slot 1 is always replaced
+SCORE_OFFSET = 1 << 31  # scores are stored unsigned in the top 32 bits
+
+"""
+Helper method to get the 12-bit code of a move (from square * 64 + to square)
+"""
+
+
+def moveCode(move):
+    if move is None:
+        return NO_MOVE
+    return move.code & 0xFFF
+
+
+"""
+Helper methods to pack and unpack the data word of an entry
+- bits 0-11 best move, 12-13 bound, 14-21 depth, 22-29 search generation, 32-63 score
+"""
+
+
+def packEntry(depth, score, bound, move, generation):
+    return (score + SCORE_OFFSET) << 32 | generation << 22 | depth << 14 | bound << 12 | move
+
+
+def unpackEntry(data):
+    return (data >> 14) & 0xFF, (data >> 32) - SCORE_OFFSET, (data >> 12) & 0x3, data & 0xFFF
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        self.resize(sizeMB)
+
+    """
+    Method to (re)allocate the table inside the memory budget, dropping every entry
+    """
+
+    def resize(self, sizeMB):
+        buckets = max(1, int(sizeMB * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SLOTS))
+        buckets = 1 << (buckets.bit_length() - 1)  # power of two so the index is a mask
+        self.sizeMB = sizeMB
+        self.mask = buckets - 1
+        self.keys = array('Q', bytes(8 * buckets * BUCKET_SLOTS))
+        self.data = array('Q', bytes(8 * buckets * BUCKET_SLOTS))
+        self.generation = 0
+        self.resetStats()
+
+    def clear(self):
+        self.resize(self.sizeMB)
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0  # misses where the bucket held other positions
+        self.stores = 0
+
+    """
+    Method to call at the start of every search so entries of older searches can be replaced first
+    """
+
+    def newSearch(self):
+        self.generation = (self.generation + 1) & 0xFF
+
+    """
+    Method to look up a position, returns (depth, score, bound, move code) or None
+    """
+
+    def probe(self, key):
+        index = (key & self.mask) << 1
+        keys = self.keys
+        if keys[index] == key:
+            slot = index
+        elif keys[index + 1] == key:
+            slot = index + 1
+        else:
+            self.misses += 1
+            if keys[index] or keys[index + 1]:
+                self.collisions += 1
+            return None
+        self.hits += 1
+        return unpackEntry(self.data[slot])
+
+    """
+    Method to save a search result
+    - the depth-preferred slot takes the entry if it is for the same position, from an older search,
+      or not deeper than the new one, otherwise the entry goes to the always-replace slot
+    """
+
+    def store(self, key, depth, score, bound, move):
+        index = (key & self.mask) << 1
+        keys = self.keys
+        data = self.data
+        stored = data[index]
+        if keys[index] == key or ((stored >> 22) & 0xFF) != self.generation or ((stored >> 14) & 0xFF) <= depth:
+            slot = index
+        else:
+            slot = index + 1
+        if move == NO_MOVE and keys[slot] == key:  # keep the best move we already know
+            move = data[slot] & 0xFFF
+        keys[slot] = key
+        data[slot] = packEntry(depth, score, bound, move, self.generation)
+        self.stores += 1
+
+    """
+    Method to get the usage statistics of the table
+    """
+
+    def getStats(self):
+        probes = self.hits + self.misses
+        used = sum(1 for key in self.keys if key)
+        return {"hits": self.hits, "misses": self.misses, "collisions": self.collisions, "stores": self.stores,
+                "hitRate": self.hits / probes if probes else 0.0, "fill": used / len(self.keys)}
+
+
+"""
+Class of the evaluation cache: the static score of recently evaluated positions by Zobrist key,
+bounded to a number of entries, the least recently used one is dropped when it is full
+- a size of 0 turns the cache off
+"""
+
+
+class EvalCache():
+    def __init__(self, size=1 << 16):
+        self.resize(size)
+
+    """
+    Method to change the number of entries the cache can hold (drops its contents)
+    """
+
+    def resize(self, size):
+        self.size = max(0, int(size))
+        self.entries = OrderedDict()
+        self.resetStats()
+
+    def clear(self):
+        self.entries.clear()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    """
+    Method to look up the score of a position, returns None when it isn't cached
+    """
+
+    def probe(self, key):
+        score = self.entries.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return score
+
+    def store(self, key, score):
+        if self.size == 0:
+            return
+        entries = self.entries
+        entries[key] = score
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    """
+    Method to get the usage statistics of the cache
+    """
+
+    def getStats(self):
+        probes = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hitRate": self.hits / probes if probes else 0.0,
+                "fill": len(self.entries) / self.size if self.size else 0.0}
+
+
+"""
+Class of a transposition table living in shared memory, so several search processes (Lazy SMP) share it
+- entries are written without locks, the key slot holds key ^ data so an entry torn by a concurrent write
+  no longer verifies and reads as a miss
+- the process that creates the table owns it and unlinks it, its worker processes attach by name
+"""
+
+
+class SharedTranspositionTable(TranspositionTable):
+    def __init__(self, sizeMB=16, name=None):
+        self.memory = None
+        self.owner = name is None
+        self.name = name
+        self.resize(sizeMB)
+
+    def resize(self, sizeMB):
+        buckets = max(1, int(sizeMB * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SLOTS))
+        buckets = 1 << (buckets.bit_length() - 1)
+        slots = buckets * BUCKET_SLOTS
+        self.release()
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=slots * ENTRY_BYTES)
+            self.memory.buf[:] = bytes(slots * ENTRY_BYTES)
+            self.name = self.memory.name
+        else:
+            self.memory = shared_memory.SharedMemory(name=self.name)
+        self.words = self.memory.buf.cast('Q')
+        self.keys = self.words[:slots]
+        self.data = self.words[slots:2 * slots]
+        self.sizeMB = sizeMB
+        self.mask = buckets - 1
+        self.generation = 0
+        self.resetStats()
+
+    def clear(self):
+        self.memory.buf[:] = bytes(len(self.memory.buf))
+
+    """
+    Method kept from the private table, but here the searches share one generation:
+    whoever runs the search sets it on every process's view (see ParallelSearch.LazySMPSearch)
+    """
+
+    def newSearch(self):
+        pass
+
+    def probe(self, key):
+        index = (key & self.mask) << 1
+        keys = self.keys
+        data = self.data
+        for slot in (index, index + 1):
+            entry = data[slot]
+            if keys[slot] ^ entry == key:
+                self.hits += 1
+                return unpackEntry(entry)
+        self.misses += 1
+        if keys[index] or keys[index + 1]:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        index = (key & self.mask) << 1
+        keys = self.keys
+        data = self.data
+        stored = data[index]
+        sameKey = keys[index] ^ stored == key
+        if sameKey or ((stored >> 22) & 0xFF) != self.generation or ((stored >> 14) & 0xFF) <= depth:
+            slot = index
+        else:
+            slot = index + 1
+            stored = data[slot]
+            sameKey = keys[slot] ^ stored == key
+        if move == NO_MOVE and sameKey:
+            move = stored & 0xFFF
+        entry = packEntry(depth, score, bound, move, self.generation)
+        data[slot] = entry
+        keys[slot] = key ^ entry
+        self.stores += 1
+
+    """
+    Method to close this process's view of the table, the owner also frees the memory
+    """
+
+    def release(self):
+        if self.memory is None:
+            return
+        self.keys.release()
+        self.data.release()
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
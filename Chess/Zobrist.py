@@ -0,0 +1,99 @@
+"""
+This script contains the Zobrist hashing of our engine
+every position gets a 64-bit key built by xor-ing one random number per
+piece on its square, the side to move, the castling rights and the en passant file,
+so a move only has to xor in the few numbers it changes
+"""
+
+import random
+
+"""
+CONSTANTS
+"""
+
+SEED = 20240601  # fixed so keys are the same in every process and every run
+PIECES = ('wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK')
+
+_generator = random.Random(SEED)
+# PIECE_KEYS[piece][r * 8 + c]
+PIECE_KEYS = {piece: [_generator.getrandbits(64) for _ in range(64)] for piece in PIECES}
+BLACK_TO_MOVE_KEY = _generator.getrandbits(64)
+_castlingRightKeys = [_generator.getrandbits(64) for _ in range(4)]  # wks, wqs, bks, bqs
+# one key per combination of castling rights, indexed by the bits wks=1, wqs=2, bks=4, bqs=8
+CASTLING_KEYS = [0] * 16
+for _index in range(16):
+    for _bit in range(4):
+        if _index & (1 << _bit):
+            CASTLING_KEYS[_index] ^= _castlingRightKeys[_bit]
+EN_PASSANT_KEYS = [_generator.getrandbits(64) for _ in range(8)]  # by file
+
+"""
+Helper method to get the key of a set of castling rights
+"""
+
+
+def castlingKey(rights):
+    return CASTLING_KEYS[rights.wks | rights.wqs << 1 | rights.bks << 2 | rights.bqs << 3]
+
+
+"""
+Helper method to get the en passant key of a position, only the file matters,
+and only when a pawn of the side to move stands next to the pawn that was pushed:
+otherwise the position is the same as without the double push, so it must get the same key for repetitions
+"""
+
+
+def enPassantKey(gamestate):
+    enPassantPossible = gamestate.enPassantPossible
+    if not enPassantPossible:
+        return 0
+    epRow, epCol = enPassantPossible
+    pawnRow, pawn = (epRow + 1, "wp") if gamestate.whiteToMove else (epRow - 1, "bp")
+    row = gamestate.board[pawnRow]
+    if (epCol > 0 and row[epCol - 1] == pawn) or (epCol < 7 and row[epCol + 1] == pawn):
+        return EN_PASSANT_KEYS[epCol]
+    return 0
+
+
+"""
+Method to get the xor of all piece keys a move changes on the board,
+including captures, en passant, promotion and the castling rook
+"""
+
+
+def movePiecesKey(move):
+    startSq = move.startRow * 8 + move.startCol
+    endSq = move.endRow * 8 + move.endCol
+    color = move.pieceMoved[0]
+    delta = PIECE_KEYS[move.pieceMoved][startSq]
+    delta ^= PIECE_KEYS[color + 'Q' if move.isPawnPromotion else move.pieceMoved][endSq]
+    if move.isEnPassantMove:
+        delta ^= PIECE_KEYS[move.pieceCaptured][move.startRow * 8 + move.endCol]
+    elif move.pieceCaptured != "-":
+        delta ^= PIECE_KEYS[move.pieceCaptured][endSq]
+    if move.isCastleMove:
+        rookKeys = PIECE_KEYS[color + 'R']
+        if move.endCol - move.startCol == 2:  # kingside castle
+            delta ^= rookKeys[endSq + 1] ^ rookKeys[endSq - 1]
+        else:  # queenside castle
+            delta ^= rookKeys[endSq - 2] ^ rookKeys[endSq + 1]
+    return delta
+
+
+"""
+Method to compute the key of a position from scratch
+"""
+
+
+def hashPosition(gamestate):
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            piece = gamestate.board[r][c]
+            if piece != "-":
+                key ^= PIECE_KEYS[piece][r * 8 + c]
+    if not gamestate.whiteToMove:
+        key ^= BLACK_TO_MOVE_KEY
+    key ^= castlingKey(gamestate.currentCastlingRight)
+    key ^= enPassantKey(gamestate)
+    return key
@@ -1,31 +1,496 @@
 """
 This script contains a stockfish engine integration to our game
 for harder chess difficulties :p
+engines are long-lived UCI processes kept warm in a pool and reused across moves and games
 """
 
-import stockfish
+import atexit
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import weakref
 from Chess import Engine
 
 """
-Method to get the best move from the stockfish engine
+CONSTANTS
 """
 
+PATH_VARIABLE = "STOCKFISH_PATH"  # environment variable naming the engine binary
+FALLBACK_PATH = '../stockfish/stockfish-windows-x86-64-avx2.exe'
+POOL_SIZE = 1
+STARTUP_TIMEOUT = 10.0  # seconds to wait for uciok / readyok
+STOP_MARGIN = 1.0  # seconds past movetime before the search is stopped by hand
+POLL_INTERVAL = 0.1  # seconds between checks while waiting for a best move
+
 gamestate = Engine.GameState()
 
 
-def getBestMove(fen_position, stockfish_path, validMoves, depth_value=15):
-    # Stockfish init
-    engine = stockfish.Stockfish(stockfish_path)
-    # Set difficulty
-    engine.set_depth(depth_value)
-    # Set position
-    engine.set_fen_position(fen_position)
-    # Get best move
-    best_move = engine.get_best_move()
+class EngineError(Exception):
+    pass
+
+
+class EngineTimeout(EngineError):
+    pass
+
+
+"""
+Class wrapping one UCI engine process
+- a reader thread moves every output line into a queue so reads can time out
+"""
+
+
+class UCIEngine():
+    def __init__(self, command, options=None):
+        self.command = [command] if isinstance(command, str) else list(command)
+        self.options = dict(options or {})
+        self.process = None
+        self.lines = None
+        self.writeLock = threading.Lock()  # stop may be sent from another thread while a search runs
+        self.searching = False
+        self.pondering = False  # searching the predicted reply on the opponent's time ('go ponder')
+        self.ponderLock = threading.Lock()  # the ponder hit can come from the game thread and the search thread
+        self.game = None  # weak reference to the game state the engine last searched
+        self.syncedMoves = []  # the game's move log as last sent to the engine
+        self.uciMoves = []  # the same moves in UCI notation
+        self.start()
+
+    """
+    Method to launch the process and run the UCI handshake
+    """
+
+    def start(self):
+        try:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL, universal_newlines=True, bufsize=1)
+        except OSError as error:
+            raise EngineError("could not start engine %s: %s" % (self.command, error))
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self.readOutput, args=(self.process.stdout, self.lines), daemon=True)
+        reader.start()
+        self.game = None
+        self.syncedMoves = []
+        self.uciMoves = []
+        self.send("uci")
+        self.waitFor("uciok", STARTUP_TIMEOUT)
+        for name, value in self.options.items():
+            self.send("setoption name %s value %s" % (name, value))
+        self.isReady()
+
+    def readOutput(self, stdout, lines):
+        for line in stdout:
+            lines.put(line.strip())
+        lines.put(None)  # end of output, the process died or quit
+
+    def isAlive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, command):
+        if not self.isAlive():
+            raise EngineError("engine process is not running")
+        try:
+            with self.writeLock:
+                self.process.stdin.write(command + "\n")
+                self.process.stdin.flush()
+        except (OSError, ValueError) as error:
+            raise EngineError("could not write to engine: %s" % error)
+
+    """
+    Method to read output lines until one starts with the prefix, returns that line
+    - timeout None waits as long as the process is alive
+    """
+
+    def waitFor(self, prefix, timeout=None):
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            if deadline is not None and time.time() >= deadline:
+                raise EngineTimeout("engine did not answer '%s' in time" % prefix)
+            try:
+                line = self.lines.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not self.isAlive():
+                    raise EngineError("engine process died")
+                continue
+            if line is None:
+                raise EngineError("engine process died")
+            if line.startswith(prefix):
+                return line
+
+    def isReady(self):
+        self.send("isready")
+        self.waitFor("readyok", STARTUP_TIMEOUT)
+
+    def setOption(self, name, value):
+        self.options[name] = value
+        self.send("setoption name %s value %s" % (name, value))
+
+    """
+    Method to tell the engine a different game starts, so it drops its hash
+    """
+
+    def newGame(self):
+        self.send("ucinewgame")
+        self.isReady()
+        self.game = None
+        self.syncedMoves = []
+        self.uciMoves = []
+
+    """
+    Method to build the UCI position command argument of a game: its start position plus the moves played,
+    only the moves played (or taken back) since the last call are converted
+    """
+
+    def positionCommand(self, gamestate, moveLog=None):
+        if gamestate.startFen is None:  # custom board without a known history, send the position itself
+            return "fen " + getFen(gamestate)
+        if moveLog is None:
+            moveLog = gamestate.moveLog
+        synced = self.syncedMoves
+        # the whole prefix is compared: moves are pooled, so after an undo the same Move can follow another history
+        common = 0
+        while common < len(synced) and common < len(moveLog) and synced[common] is moveLog[common]:
+            common += 1
+        del synced[common:]
+        del self.uciMoves[common:]
+        for move in moveLog[common:]:
+            synced.append(move)
+            self.uciMoves.append(uciMove(move))
+        start = "startpos" if gamestate.startFen == Engine.START_FEN else "fen " + gamestate.startFen
+        return start + (" moves " + " ".join(self.uciMoves) if self.uciMoves else "")
+
+    """
+    Method to search a position, returns (best move, expected reply or None) in UCI notation
+    - position is the argument of the UCI position command, e.g: "fen <fen>" or "startpos moves e2e4"
+    - go is the argument of the UCI go command, e.g: "depth 15" or "movetime 500"
+    - after timeout seconds the search is stopped and the engine's best move so far is taken
+    - ponder searches on the opponent's time, without a time limit until ponderHit() is called
+      or the latched hit signal returns True (polled, so a hit that came before 'go ponder' is not lost)
+    """
+
+    def bestMove(self, position, go, timeout=None, ponder=False, hitSignal=None):
+        self.send("position " + position)
+        if ponder and hitSignal is not None and hitSignal():  # the predicted move was played already
+            ponder = False
+        self.searching = True
+        with self.ponderLock:
+            self.pondering = ponder
+        started = time.time()
+        try:
+            self.send(("go ponder " if ponder else "go ") + go)
+            while True:
+                if self.pondering and hitSignal is not None and hitSignal():
+                    self.ponderHit()
+                try:
+                    line = self.waitFor("bestmove", POLL_INTERVAL)
+                    break
+                except EngineTimeout:
+                    if self.pondering:
+                        started = time.time()  # the clock only runs once the ponder move is played
+                    elif timeout is not None and time.time() - started >= timeout:
+                        self.send("stop")
+                        line = self.waitFor("bestmove", STARTUP_TIMEOUT)
+                        break
+        finally:
+            self.searching = False
+            self.pondering = False
+        tokens = line.split()
+        bestMove = tokens[1] if len(tokens) > 1 else None
+        ponderMove = tokens[3] if len(tokens) > 3 and tokens[2] == "ponder" else None
+        if bestMove in (None, "(none)", "0000"):
+            bestMove = None
+        return bestMove, ponderMove
+
+    """
+    Method to make a running search answer right away, safe to call from another thread
+    """
+
+    def stop(self):
+        if self.searching and self.isAlive():
+            try:
+                self.send("stop")
+            except EngineError:
+                pass
+
+    """
+    Method to tell a pondering engine its predicted move was played, the search goes on as a normal one
+    """
+
+    def ponderHit(self):
+        with self.ponderLock:
+            if not self.pondering or not self.isAlive():
+                return
+            self.pondering = False
+        try:
+            self.send("ponderhit")
+        except EngineError:
+            pass
+
+    """
+    Method to stop the process, politely first
+    """
+
+    def quit(self):
+        if self.process is None:
+            return
+        if self.isAlive():
+            try:
+                self.send("quit")
+                self.process.wait(timeout=2)
+            except (EngineError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.process = None
+
+
+"""
+Class keeping a pool of warm engine processes
+- engines are started lazily up to size and handed out one caller at a time
+- a dead engine is restarted when it is handed out, or when it dies during a search
+"""
+
+
+class EnginePool():
+    def __init__(self, command, size=POOL_SIZE, options=None):
+        self.command = command
+        self.size = size
+        self.options = dict(options or {})
+        self.engines = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def acquire(self):
+        if self.closed:
+            raise EngineError("engine pool is shut down")
+        with self.lock:
+            if self.idle.empty() and len(self.engines) < self.size:
+                engine = UCIEngine(self.command, self.options)
+                self.engines.append(engine)
+                return engine
+        engine = self.idle.get()
+        if not engine.isAlive():
+            engine.quit()
+            try:
+                engine.start()
+            except EngineError:  # drop it so a later acquire starts a new engine instead of waiting forever
+                engine.quit()
+                with self.lock:
+                    if engine in self.engines:
+                        self.engines.remove(engine)
+                raise
+        return engine
+
+    def release(self, engine):
+        if self.closed:
+            engine.quit()
+        else:
+            self.idle.put(engine)
+
+    """
+    Method to search a position for the given game state on one of the pool's engines,
+    the engine gets a ucinewgame first when it last worked on another game (or no game state is given)
+    - game is the object that identifies the game, by default the game state itself,
+      e.g: the live game when a snapshot of it is searched from another thread
+    - position None sends the game's start position and move history, so the engine keeps its hash between turns,
+      moveLog can pin that history (e.g: a copy taken before another thread moves on), ponderMove is appended to it
+    - hitSignal latches the ponder hit, see UCIEngine.bestMove
+    """
+
+    def bestMove(self, gamestate, position, go, timeout=None, moveLog=None, ponderMove=None, hitSignal=None,
+                 game=None):
+        if game is None:
+            game = gamestate
+        engine = self.acquire()
+        try:
+            for attempt in range(2):
+                try:
+                    if game is None or engine.game is None or engine.game() is not game:
+                        engine.newGame()
+                        if game is not None:
+                            engine.game = weakref.ref(game)
+                    command = position if position is not None else engine.positionCommand(gamestate, moveLog)
+                    if ponderMove is not None:
+                        command += (" " if " moves " in command else " moves ") + uciMove(ponderMove)
+                    return engine.bestMove(command, go, timeout, ponderMove is not None, hitSignal)
+                except EngineError:
+                    if attempt == 1:
+                        raise
+                    engine.quit()  # the process died or hung, start a fresh one and retry once
+                    engine.start()
+        finally:
+            self.release(engine)
+
+    def stopSearches(self):
+        for engine in list(self.engines):
+            engine.stop()
+
+    def ponderHit(self):
+        for engine in list(self.engines):
+            engine.ponderHit()
+
+    def shutdown(self):
+        self.closed = True
+        with self.lock:
+            for engine in self.engines:
+                engine.quit()
+            self.engines = []
+
+
+"""
+Method to find the stockfish binary: the STOCKFISH_PATH environment variable first,
+then a stockfish executable on PATH, then the bundled windows build next to the repository
+"""
+
+
+def findStockfishPath():
+    path = os.environ.get(PATH_VARIABLE)
+    if path:
+        return path
+    for name in ("stockfish", "stockfish.exe"):
+        path = shutil.which(name)
+        if path:
+            return path
+    return FALLBACK_PATH
+
+
+"""
+Class holding how stockfish is run and how long it may think
+- threads, hashMB and skillLevel are UCI options fixed for the life of the process
+- moveTime (milliseconds), nodes and depth limit each search, any of them can be None
+"""
+
+
+class StockfishConfig():
+    def __init__(self, path=None, threads=1, hashMB=16, skillLevel=20, moveTime=None, nodes=None, depth=None):
+        self.path = path if path is not None else findStockfishPath()
+        self.threads = threads
+        self.hashMB = hashMB
+        self.skillLevel = skillLevel
+        self.moveTime = moveTime
+        self.nodes = nodes
+        self.depth = depth
+
+    def engineOptions(self):
+        return {"Threads": self.threads, "Hash": self.hashMB, "Skill Level": self.skillLevel}
 
+    """
+    Method to build the arguments of the UCI go command, searching to depth 15 when nothing limits it
+    """
+
+    def goCommand(self):
+        limits = []
+        if self.moveTime is not None:
+            limits.append("movetime %d" % self.moveTime)
+        if self.nodes is not None:
+            limits.append("nodes %d" % self.nodes)
+        if self.depth is not None or not limits:
+            limits.append("depth %d" % (self.depth if self.depth is not None else 15))
+        return " ".join(limits)
+
+    """
+    Method to get how long to wait for an answer before stopping the search by hand, None waits forever
+    """
+
+    def timeout(self):
+        return self.moveTime / 1000 + STOP_MARGIN if self.moveTime is not None else None
+
+
+# difficulty presets, the search is bounded by time so the answer comes in about moveTime ms on any machine
+DIFFICULTY_PRESETS = {
+    'easy': {"skillLevel": 3, "moveTime": 100, "depth": 5},
+    'medium': {"skillLevel": 10, "moveTime": 300, "depth": 10},
+    'hard': {"skillLevel": 20, "moveTime": 1000, "hashMB": 64},
+}
+
+"""
+Method to get the config of a difficulty preset, keyword arguments override the preset
+"""
+
+
+def getStockfishConfig(level='hard', **overrides):
+    settings = dict(DIFFICULTY_PRESETS[level])
+    settings.update(overrides)
+    return StockfishConfig(**settings)
+
+
+enginePools = {}
+
+"""
+Method to get the shared pool for an engine command and its options, created on first use
+"""
+
+
+def getEnginePool(command, size=POOL_SIZE, options=None):
+    key = (command if isinstance(command, str) else tuple(command), tuple(sorted((options or {}).items())))
+    pool = enginePools.get(key)
+    if pool is None or pool.closed:
+        pool = enginePools[key] = EnginePool(command, size, options)
+    return pool
+
+
+"""
+Method to make every running stockfish search return its move now, e.g: when the player takes a move back
+"""
+
+
+def stopSearches():
+    for pool in list(enginePools.values()):
+        pool.stopSearches()
+
+
+"""
+Method to tell every pondering stockfish search that its predicted move was played
+"""
+
+
+def ponderHit():
+    for pool in list(enginePools.values()):
+        pool.ponderHit()
+
+
+"""
+Method to stop every pooled engine process, also run when the program exits
+"""
+
+
+def shutdownEngines():
+    for pool in enginePools.values():
+        pool.shutdown()
+    enginePools.clear()
+
+
+atexit.register(shutdownEngines)
+
+"""
+Method to get the best move from the stockfish engine
+- config is a StockfishConfig, by default stockfish_path searched to depth_value
+"""
+
+
+def getBestMove(fen_position, stockfish_path, validMoves, depth_value=15, gamestate=None, config=None):
+    if config is None:
+        config = StockfishConfig(path=stockfish_path, depth=depth_value)
+    pool = getEnginePool(config.path, options=config.engineOptions())
+    best_move, _ = pool.bestMove(gamestate, "fen " + fen_position, config.goCommand(), config.timeout())
     return best_move
 
 
+"""
+Method to get the UCI notation of a move, e.g: e2e4 or e7e8q (our promotions are always to a queen)
+"""
+
+
+def uciMove(move):
+    return move.getChessNotation() + ("q" if move.isPawnPromotion else "")
+
+
 """
 Method to convert our gamestate to an FEN string for stockfish evaluation
 """
@@ -81,9 +546,12 @@ def getFen(gamestate):
     else:
         en_passant_square = "-"
 
-    # Halfmove clock and fullmove number (for now, setting to 0)
-    halfmove_clock = "0"
-    fullmove_number = str(len(gamestate.moveLog) // 2 + 1)
+    # Halfmove clock and fullmove number, counted on from the start position of the move log
+    halfmove_clock = str(gamestate.halfmoveClock)
+    startFields = gamestate.startFen.split() if gamestate.startFen else []
+    startFullmove = int(startFields[5]) if len(startFields) > 5 else 1
+    blackStarted = len(startFields) > 1 and startFields[1] == "b"
+    fullmove_number = str(startFullmove + (len(gamestate.moveLog) + blackStarted) // 2)
 
     # Combine all parts to form FEN
     fen = f"{fen_board} {active_color} {castling_rights} {en_passant_square} {halfmove_clock} {fullmove_number}"
@@ -92,10 +560,17 @@ def getFen(gamestate):
 
 """
 Method to convert to convert the stockfish best move to gamestate
+- when validMoves are given the matching valid move is returned (None if there is none), so en passant and castling flags are right
 """
 
 
-def algebraToMove(move_str, gamestate):
+def algebraToMove(move_str, gamestate, validMoves=()):
+    for move in validMoves:
+        if move.getChessNotation() == move_str[:4]:  # our promotions are always to a queen
+            return move
+    if validMoves:  # not a legal move here, let the caller fall back
+        return None
+
     # Parse the move string
     startSquare = move_str[:2]
     endSquare = move_str[2:]
@@ -112,12 +587,30 @@ def algebraToMove(move_str, gamestate):
     return move
 
 
+"""
+Method to search with stockfish, returns (best move or None, the reply stockfish expects in UCI notation or None)
+- with ponderMove the search is for the position after that (predicted) move, validMoves being its valid moves,
+  and runs on the opponent's time until ponderHit() is called or hitSignal() returns True
+- game identifies the game for ucinewgame, see EnginePool.bestMove
+"""
+
+
+def searchStockfish(gamestate, validMoves, config=None, ponderMove=None, moveLog=None, hitSignal=None, game=None):
+    if config is None:
+        config = getStockfishConfig('hard')
+    pool = getEnginePool(config.path, options=config.engineOptions())
+    bestMoveStr, ponderMoveStr = pool.bestMove(gamestate, None, config.goCommand(), config.timeout(),
+                                               moveLog, ponderMove, hitSignal, game)
+    if bestMoveStr is None:
+        return None, None
+    return algebraToMove(bestMoveStr, gamestate, validMoves), ponderMoveStr
+
+
 """
 Method to call to get the best move according to stockfish
+- config is a StockfishConfig, by default the 'hard' preset
 """
-def findStockfishMove(gamestate, validMoves):
-    fen = getFen(gamestate)
-    stockfish_path = '../stockfish/stockfish-windows-x86-64-avx2.exe'
-    bestMoveStr = getBestMove(fen, stockfish_path, validMoves)
-    bestMove = algebraToMove(bestMoveStr, gamestate)
+def findStockfishMove(gamestate, validMoves, config=None):
+    bestMove, _ = searchStockfish(gamestate, validMoves, config)
     return bestMove
+
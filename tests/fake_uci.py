@@ -0,0 +1,35 @@
+"""
+A tiny stand-in for a UCI engine: answers the handshake and every search with e2e4,
+the commands it receives are appended to the log file given as its first argument
+"""
+
+import sys
+
+
+def main():
+    log = open(sys.argv[1], "a") if len(sys.argv) > 1 else None
+    pondering = False
+    for line in sys.stdin:
+        command = line.strip()
+        if log is not None:
+            log.write(command + "\n")
+            log.flush()
+        if command == "uci":
+            print("id name FakeUCI")
+            print("uciok")
+        elif command == "isready":
+            print("readyok")
+        elif command.startswith("go"):
+            pondering = command.startswith("go ponder")
+            if not pondering:
+                print("bestmove e2e4 ponder e7e5")
+        elif command in ("stop", "ponderhit") and pondering:
+            pondering = False
+            print("bestmove e2e4 ponder e7e5")
+        elif command == "quit":
+            break
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+from Chess import Book, Engine
+
+
+def playMoves(gamestate, notations):
+    for notation in notations:
+        move = next(move for move in gamestate.getValidMoves() if move.getChessNotation() == notation)
+        gamestate.makeMove(move)
+
+
+def test_start_position_key():
+    assert len(Book.RANDOM64) == 781
+    assert Book.polyglotKey(Engine.GameState()) == Book.START_KEY == 0x463B96181691FC9C
+
+
+def test_reference_keys():
+    # key after each move of the sample game in the Polyglot book format description
+    expected = [0x823C9B50FD114196, 0x0756B94461C50FB0, 0x662FAFB965DB29D4, 0x22A48B5A8E47FF78,
+                0x652A607CA3F242C1, 0x00FDD303C946BDD9]
+    gamestate = Engine.GameState()
+    for notation, key in zip(["e2e4", "d7d5", "e4e5", "f7f5", "e1e2", "e8f7"], expected):
+        playMoves(gamestate, [notation])
+        assert Book.polyglotKey(gamestate) == key
+
+
+def test_probe_standard_entry(tmp_path):
+    path = str(tmp_path / "book.bin")
+    e2e4 = 4 | 3 << 3 | 4 << 6 | 1 << 9
+    Book.writeBook(path, {(Book.START_KEY, e2e4): 10})
+    book = Book.OpeningBook(path)
+    gamestate = Engine.GameState()
+    move = book.chooseMove(gamestate, gamestate.getValidMoves())
+    book.close()
+    assert move.getChessNotation() == "e2e4"
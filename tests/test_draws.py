@@ -0,0 +1,57 @@
+from Chess import Engine, Zobrist
+
+
+def playMoves(gamestate, notations):
+    for notation in notations:
+        gamestate.makeMove(next(move for move in gamestate.getValidMoves() if move.getChessNotation() == notation))
+
+
+def test_threefold_repetition():
+    gamestate = Engine.GameState()
+    shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+    playMoves(gamestate, shuffle)
+    gamestate.getValidMoves()
+    assert gamestate.repetitionCount() == 2 and not gamestate.threefoldRepetition
+    playMoves(gamestate, shuffle)
+    gamestate.getValidMoves()
+    assert gamestate.repetitionCount() == 3 and gamestate.threefoldRepetition and gamestate.isDraw()
+    gamestate.undoMove()
+    gamestate.getValidMoves()
+    assert not gamestate.threefoldRepetition
+
+
+def test_double_push_without_en_passant_capture_repeats():
+    # after 1.e4 no black pawn can take en passant, so the position comes back after Nf6 Nf3 Ng8 Ng1
+    gamestate = Engine.GameState()
+    playMoves(gamestate, ["e2e4"])
+    for _ in range(2):
+        playMoves(gamestate, ["g8f6", "g1f3", "f6g8", "f3g1"])
+    gamestate.getValidMoves()
+    assert gamestate.repetitionCount() == 3 and gamestate.threefoldRepetition
+
+
+def test_en_passant_capture_changes_the_key():
+    # a black pawn on d4 can take e3 en passant, that position is not the one without the double push
+    withPawn = Engine.gameStateFromFen("4k3/8/8/8/3p4/8/4P3/4K3 w - - 0 1")
+    playMoves(withPawn, ["e2e4"])
+    assert withPawn.zobristKey != Engine.gameStateFromFen("4k3/8/8/8/3pP3/8/8/4K3 b - - 0 1").zobristKey
+    assert withPawn.zobristKey == Zobrist.hashPosition(withPawn)
+    withoutPawn = Engine.gameStateFromFen("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1")
+    playMoves(withoutPawn, ["e2e4"])
+    assert withoutPawn.zobristKey == Engine.gameStateFromFen("4k3/8/8/8/4P3/8/8/4K3 b - - 0 1").zobristKey
+
+
+def test_fifty_move_rule():
+    gamestate = Engine.gameStateFromFen("4k3/8/8/8/8/8/4P3/R3K3 w - - 99 80")
+    playMoves(gamestate, ["a1a2"])
+    gamestate.getValidMoves()
+    assert gamestate.halfmoveClock == 100 and gamestate.fiftyMoveRule and gamestate.isDraw()
+    gamestate.undoMove()
+    playMoves(gamestate, ["e2e3"])  # a pawn move resets the clock
+    gamestate.getValidMoves()
+    assert gamestate.halfmoveClock == 0 and not gamestate.fiftyMoveRule
+
+
+def test_insufficient_material():
+    assert Engine.gameStateFromFen("4k3/8/8/8/8/8/8/2B1K3 w - - 0 1").insufficientMaterial
+    assert not Engine.gameStateFromFen("4k3/8/8/8/8/8/8/R3K3 w - - 0 1").insufficientMaterial
@@ -0,0 +1,47 @@
+import pytest
+from Chess import Engine, Perft
+
+# positions with pins, checks, en passant and castling, each checked against the make/test/undo generator
+POSITIONS = [
+    Engine.START_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1",
+    "8/8/8/4k3/3Pp3/8/8/4K3 b - d3 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "4k3/8/8/8/1b6/8/3N4/4K3 w - - 0 1",  # knight pinned by a bishop
+    "4k3/4r3/8/8/8/8/4R3/4K3 w - - 0 1",  # rook pinned along the file, it can still move on it
+    "4k3/8/8/8/8/5n2/8/4K2r w - - 0 1",  # double check
+]
+
+
+def moveCodes(moves):
+    return sorted(move.code for move in moves)
+
+
+@pytest.mark.parametrize("backend", Engine.BACKENDS)
+@pytest.mark.parametrize("name, fen, counts", Perft.PERFT_SUITE, ids=[entry[0] for entry in Perft.PERFT_SUITE])
+def test_perft(backend, name, fen, counts):
+    for depth in sorted(counts):
+        if depth > 3:
+            break
+        assert Perft.perft(Engine.gameStateFromFen(fen, backend), depth) == counts[depth], (name, depth)
+
+
+@pytest.mark.parametrize("backend", Engine.BACKENDS)
+@pytest.mark.parametrize("fen", POSITIONS)
+def test_generators_agree(backend, fen):
+    gamestate = Engine.gameStateFromFen(fen, backend)
+    for move in [None] + gamestate.getValidMoves():  # the position itself and every position one move later
+        if move is not None:
+            gamestate.makeMove(move)
+        assert moveCodes(gamestate.getValidMoves()) == moveCodes(gamestate.getValidMovesByFiltering())
+        if move is not None:
+            gamestate.undoMove()
+
+
+def test_checkmate_and_stalemate_flags():
+    mated = Engine.gameStateFromFen("R5k1/5ppp/8/8/8/8/8/6K1 b - - 0 1")
+    assert mated.getValidMoves() == [] and mated.checkMate and not mated.staleMate
+    stalemated = Engine.gameStateFromFen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+    assert stalemated.getValidMoves() == [] and stalemated.staleMate and not stalemated.checkMate
@@ -0,0 +1,13 @@
+from Chess import Engine, MoveAI
+
+
+def test_quiescence_scores_mate_when_in_check():
+    gamestate = Engine.gameStateFromFen("R5k1/5ppp/8/8/8/8/5PPP/6K1 b - - 1 1")
+    assert MoveAI.quiescenceSearch(gamestate, -MoveAI.CHECKMATE, MoveAI.CHECKMATE, -1) == -MoveAI.CHECKMATE
+
+
+def test_search_sees_back_rank_mate_behind_the_horizon():
+    gamestate = Engine.gameStateFromFen("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+    validMoves = gamestate.getValidMoves()
+    score = MoveAI.findNegaMaxAlphaBeta(gamestate, validMoves, 1, -MoveAI.CHECKMATE, MoveAI.CHECKMATE, 1)
+    assert score == MoveAI.CHECKMATE and MoveAI.nextMove.getChessNotation() == "a1a8"
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import pytest
+from Chess import Engine, stock
+
+FAKE_UCI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_uci.py")
+
+
+@pytest.fixture
+def pool(tmp_path):
+    log = str(tmp_path / "commands.log")
+    pool = stock.EnginePool([sys.executable, FAKE_UCI, log], size=1)
+    pool.log = log
+    yield pool
+    pool.shutdown()
+
+
+def playMoves(gamestate, notations):
+    for notation in notations:
+        gamestate.makeMove(next(move for move in gamestate.getValidMoves() if move.getChessNotation() == notation))
+
+
+def commands(pool):
+    with open(pool.log) as log:
+        return log.read().splitlines()
+
+
+def test_engine_reused_across_moves(pool):
+    gamestate = Engine.GameState()
+    assert pool.bestMove(gamestate, None, "depth 1") == ("e2e4", "e7e5")
+    process = pool.engines[0].process
+    playMoves(gamestate, ["e2e4"])
+    pool.bestMove(gamestate, None, "depth 1")
+    assert len(pool.engines) == 1 and pool.engines[0].process is process
+    sent = commands(pool)
+    assert sent.count("uci") == 1
+    assert sent.count("ucinewgame") == 1
+    assert "position startpos moves e2e4" in sent
+
+
+def test_history_resynced_after_undo(pool):
+    gamestate = Engine.GameState()
+    playMoves(gamestate, ["e2e4", "e7e5", "g1f3"])
+    pool.bestMove(gamestate, None, "depth 1")
+    for _ in range(3):
+        gamestate.undoMove()
+    playMoves(gamestate, ["d2d4", "e7e5", "g1f3"])  # the last move is the same pooled Move object as before
+    pool.bestMove(gamestate, None, "depth 1")
+    assert commands(pool)[-2] == "position startpos moves d2d4 e7e5 g1f3"
+
+
+def test_new_game_on_game_change(pool):
+    first, second = Engine.GameState(), Engine.GameState()
+    pool.bestMove(first, None, "depth 1")
+    pool.bestMove(first, None, "depth 1")
+    pool.bestMove(second, None, "depth 1")
+    assert commands(pool).count("ucinewgame") == 2
+
+
+def test_snapshots_of_one_game_share_the_engine_game(pool):
+    game = Engine.GameState()
+    pool.bestMove(Engine.gameStateFromHistory(*game.serialize()), None, "depth 1", game=game)
+    playMoves(game, ["e2e4", "e7e5"])
+    pool.bestMove(Engine.gameStateFromHistory(*game.serialize()), None, "depth 1", game=game)
+    sent = commands(pool)
+    assert sent.count("ucinewgame") == 1
+    assert "position startpos moves e2e4 e7e5" in sent
+
+
+def test_killed_engine_restarted(pool):
+    gamestate = Engine.GameState()
+    pool.bestMove(gamestate, None, "depth 1")
+    engine = pool.engines[0]
+    engine.process.kill()
+    engine.process.wait()
+    assert pool.bestMove(gamestate, None, "depth 1")[0] == "e2e4"
+    assert engine.isAlive()
+    assert commands(pool).count("uci") == 2
+
+
+def test_failed_restart_does_not_block(pool):
+    pool.bestMove(None, "startpos", "depth 1")
+    engine = pool.engines[0]
+    command = engine.command
+    engine.command = [os.path.join(os.path.dirname(FAKE_UCI), "missing-engine")]
+    engine.process.kill()
+    engine.process.wait()
+    with pytest.raises(stock.EngineError):
+        pool.acquire()
+    assert pool.engines == []
+    pool.command = command
+    assert pool.bestMove(None, "startpos", "depth 1")[0] == "e2e4"  # a new engine, not a wait on the dead one
+
+
+def test_shutdown(pool):
+    pool.bestMove(None, "startpos", "depth 1")
+    process = pool.engines[0].process
+    pool.shutdown()
+    assert process.wait(timeout=5) is not None
+    assert pool.engines == []
+    with pytest.raises(stock.EngineError):
+        pool.acquire()
+    assert "quit" in commands(pool)
+
+
+def test_ponder_hit_before_go_ponder(pool):
+    gamestate = Engine.GameState()
+    e2e4 = next(move for move in gamestate.getValidMoves() if move.getChessNotation() == "e2e4")
+    assert pool.bestMove(gamestate, None, "depth 1", ponderMove=e2e4, hitSignal=lambda: True)[0] == "e2e4"
+    sent = commands(pool)
+    assert "go depth 1" in sent and "go ponder depth 1" not in sent
+
+
+def test_ponder_hit_latched_while_pondering(pool):
+    gamestate = Engine.GameState()
+    e2e4 = next(move for move in gamestate.getValidMoves() if move.getChessNotation() == "e2e4")
+    hitTime = time.time() + 0.3  # the move is played while the engine ponders, nobody calls ponderHit()
+    assert pool.bestMove(gamestate, None, "depth 1", ponderMove=e2e4, hitSignal=lambda: time.time() >= hitTime)[0]
+    sent = commands(pool)
+    assert sent.index("go ponder depth 1") < sent.index("ponderhit")